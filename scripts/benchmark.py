@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the git and macOS build hot paths.
+
+Builds synthetic repositories in a temporary directory (a plain repo, a
+repo with N linked worktrees and a repo with a large packed-refs file),
+puts fake `ssh` and `rsync` executables with configurable latency first on
+PATH, and times the functions every container session and build goes
+through. Each case records wall time and the number of subprocesses it
+started (git via git_utils.get_git_command_count, ssh and rsync via the
+fakes' invocation log).
+
+Results can be saved as a JSON baseline and later runs compared against
+it: a case regresses when its best (minimum) time grows by more than the threshold
+(and by more than a small absolute noise floor), or when it starts more
+subprocesses per call than before. Baselines are per machine and are kept
+under ~/.claude-docker/benchmarks/ by default.
+
+Usage:
+    python3 scripts/benchmark.py --save-baseline
+    python3 scripts/benchmark.py                      # compare, exit 1 on regression
+    python3 scripts/benchmark.py --only git --repeat 50 --json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import git_utils
+import macos_builder
+
+# Absolute slowdown (ms) below which a relative regression is treated as noise
+NOISE_FLOOR_MS = 1.0
+
+# Fake ssh: answers -O check/exit from the control socket file, creates the
+# socket for ControlMaster=yes, pays the handshake latency for direct
+# connections and the mux latency for multiplexed ones, then runs the
+# remote command locally.
+_FAKE_SSH = r'''#!{python}
+import os, sys, time
+args = sys.argv[1:]
+control_path = next((a.split("=", 1)[1] for a in args if a.startswith("ControlPath=")), None)
+with open(os.environ["BENCH_FAKE_LOG"], "a") as log:
+    log.write("ssh\n")
+if "-O" in args:
+    op = args[args.index("-O") + 1]
+    alive = bool(control_path) and os.path.exists(control_path)
+    if op == "exit" and alive:
+        os.unlink(control_path)
+    sys.exit(0 if alive else 255)
+handshake = float(os.environ.get("BENCH_SSH_LATENCY_MS", "50")) / 1000
+mux = float(os.environ.get("BENCH_SSH_MUX_LATENCY_MS", "2")) / 1000
+if "ControlMaster=yes" in args:
+    time.sleep(handshake)
+    open(control_path, "w").close()
+    sys.exit(0)
+if control_path and os.path.exists(control_path) and "ControlMaster=no" in args:
+    time.sleep(mux)
+else:
+    time.sleep(handshake)
+os.execvp("bash", ["bash", "-c", args[-1]])
+'''
+
+# Fake rsync: reads the file list, pays one mux round trip and reports the
+# bytes it would have sent
+_FAKE_RSYNC = r'''#!{python}
+import os, sys, time
+with open(os.environ["BENCH_FAKE_LOG"], "a") as log:
+    log.write("rsync\n")
+files = [f for f in sys.stdin.read().split("\0") if f]
+time.sleep(float(os.environ.get("BENCH_SSH_MUX_LATENCY_MS", "2")) / 1000)
+print(f"Number of files: {len(files)}")
+print("Total bytes sent: 0")
+'''
+
+
+def get_default_baseline_path():
+    """Get the per-machine baseline file under ~/.claude-docker/benchmarks/."""
+    return git_utils.get_claude_docker_dir() / "benchmarks" / "baseline.json"
+
+
+def _git(cwd, *args):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+
+
+def create_plain_repo(path):
+    """
+    Create a small repository with one commit and a Rust project layout.
+
+    Args:
+        path (Path): Directory to create
+
+    Returns:
+        Path: The repository path
+    """
+    path.mkdir(parents=True)
+    _git(path, "init", "-q", "-b", "main")
+    _git(path, "config", "user.email", "bench@example.com")
+    _git(path, "config", "user.name", "bench")
+    _git(path, "remote", "add", "origin", "https://example.com/bench.git")
+    (path / "Cargo.toml").write_text('[package]\nname = "bench"\nversion = "0.1.0"\n')
+    (path / "src").mkdir()
+    for i in range(50):
+        (path / "src" / f"mod_{i}.rs").write_text(f"pub fn f{i}() -> u32 {{ {i} }}\n")
+    (path / ".env").write_text("NATIVE_TEST_COMMAND=cargo test --quiet\n")
+    _git(path, "add", "-A")
+    _git(path, "commit", "-q", "-m", "initial")
+    return path
+
+
+def create_worktree_repo(path, worktrees):
+    """
+    Create a repository with `worktrees` linked worktrees next to it.
+
+    Args:
+        path (Path): Directory of the main worktree
+        worktrees (int): Number of linked worktrees to add
+
+    Returns:
+        Path: Path of the last linked worktree, where the cases run
+    """
+    create_plain_repo(path)
+    current = path
+    for i in range(worktrees):
+        current = path.parent / f"{path.name}-wt{i}"
+        _git(path, "worktree", "add", "-q", "-b", f"feature-{i}", str(current))
+    return current
+
+
+def create_packed_refs_repo(path, refs):
+    """
+    Create a repository whose packed-refs file holds `refs` branches and tags.
+
+    Args:
+        path (Path): Directory to create
+        refs (int): Number of packed refs
+
+    Returns:
+        Path: The repository path
+    """
+    create_plain_repo(path)
+    head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=path, check=True,
+                          capture_output=True, text=True).stdout.strip()
+    lines = [f"{head} refs/heads/main"]
+    lines += [f"{head} refs/heads/branch-{i:06d}" for i in range(refs // 2)]
+    lines += [f"{head} refs/tags/v{i:06d}" for i in range(refs - refs // 2)]
+    lines.sort(key=lambda line: line.split(" ", 1)[1])
+    (path / ".git" / "packed-refs").write_text("# pack-refs with: peeled fully-peeled sorted \n" + "\n".join(lines) + "\n")
+    (path / ".git" / "refs" / "heads" / "main").unlink()
+    return path
+
+
+def install_fake_remote(root):
+    """
+    Write the fake ssh and rsync into root/bin and configure the environment.
+
+    The environment is pointed at private copies of everything the code
+    under test touches (CLAUDE_DOCKER_HOME, the ssh control directory,
+    the key) so a run never reads or writes the user's state.
+
+    Args:
+        root (Path): Scratch directory of this run
+
+    Returns:
+        Path: Invocation log the fakes append to, one line per process
+    """
+    bin_dir = root / "bin"
+    bin_dir.mkdir()
+    for name, source in (("ssh", _FAKE_SSH), ("rsync", _FAKE_RSYNC)):
+        script = bin_dir / name
+        script.write_text(source.replace("{python}", sys.executable))
+        script.chmod(0o755)
+    key = root / "id_rsa"
+    key.write_text("fake key\n")
+    log = root / "fake-remote.log"
+    log.touch()
+
+    os.environ.update({
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+        "BENCH_FAKE_LOG": str(log),
+        "BENCH_SSH_KEY": str(key),
+        "CLAUDE_DOCKER_HOME": str(root / "claude-docker"),
+        "MACOS_SSH_CONTROL_DIR": str(root / "control"),
+        "MACOS_SSH_KEEP_MASTER": "false",
+        "ENABLE_MACOS_BUILDS": "true",
+        "MACOS_HOST": "bench-host",
+        "MACOS_USERNAME": "bench",
+    })
+    for name in [n for n in os.environ if n.startswith("NATIVE_") and n.endswith("_COMMAND")]:
+        del os.environ[name]
+    return log
+
+
+def _count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def measure(func, repeat, warmup, fake_log, before_each=None):
+    """
+    Time func and count the subprocesses it starts.
+
+    Args:
+        func (callable): Case body, called without arguments
+        repeat (int): Timed calls
+        warmup (int): Untimed calls made first
+        fake_log (Path): Invocation log of the fake ssh/rsync
+        before_each (callable): Untimed setup run before every call
+
+    Returns:
+        dict: median_ms, min_ms, mean_ms, git_per_call, remote_per_call
+              and subprocesses_per_call
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            if before_each:
+                before_each()
+            func()
+
+        git_before = git_utils.get_git_command_count()
+        remote_before = _count_lines(fake_log)
+        timings = []
+        for _ in range(repeat):
+            if before_each:
+                before_each()
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        git_calls = git_utils.get_git_command_count() - git_before
+        remote_calls = _count_lines(fake_log) - remote_before
+
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "git_per_call": round(git_calls / repeat, 2),
+        "remote_per_call": round(remote_calls / repeat, 2),
+        "subprocesses_per_call": round((git_calls + remote_calls) / repeat, 2)
+    }
+
+
+def _without_fast_path(func):
+    """Wrap func so it runs with the .git file reader disabled (git CLI only)."""
+    def wrapper():
+        os.environ["CLAUDE_GIT_FAST_PATH"] = "false"
+        try:
+            return func()
+        finally:
+            del os.environ["CLAUDE_GIT_FAST_PATH"]
+    return wrapper
+
+
+def build_cases(root, worktrees, refs):
+    """
+    Create the fixtures and return the benchmark cases.
+
+    Args:
+        root (Path): Scratch directory of this run
+        worktrees (int): Linked worktrees in the worktree fixture
+        refs (int): Packed refs in the packed-refs fixture
+
+    Returns:
+        list: (name, func, before_each) tuples
+    """
+    plain = str(create_plain_repo(root / "plain"))
+    worktree = str(create_worktree_repo(root / "worktrees" / "main", worktrees))
+    packed = str(create_packed_refs_repo(root / "packed-refs", refs))
+    repos = {"plain": plain, f"worktrees{worktrees}": worktree, f"packed{refs}": packed}
+
+    cases = []
+    for label, path in repos.items():
+        cases.append((f"get_git_repo_info[{label}]", lambda p=path: git_utils.get_git_repo_info(p), None))
+        cases.append((f"get_worktree_info[{label}]", lambda p=path: git_utils.get_worktree_info(p), None))
+        cases.append((f"get_cached_git_repo_info[{label}]", lambda p=path: git_utils.get_cached_git_repo_info(p), None))
+        cases.append((f"get_git_repo_info[{label},cli]",
+                      _without_fast_path(lambda p=path: git_utils.get_git_repo_info(p)), None))
+
+    cases += [
+        ("get_configured_build_commands[cold]",
+         lambda: macos_builder.get_configured_build_commands(worktree),
+         macos_builder.clear_build_config_cache),
+        ("get_configured_build_commands[warm_disk]",
+         lambda: macos_builder.get_configured_build_commands(worktree),
+         macos_builder._build_config_memory_cache.clear),
+        ("get_configured_build_commands[warm_memory]",
+         lambda: macos_builder.get_configured_build_commands(worktree), None),
+        ("detect_project_type[plain]", lambda: macos_builder.detect_project_type(plain), None),
+    ]
+
+    builder = macos_builder.MacOSBuilder(ssh_key_path=os.environ["BENCH_SSH_KEY"], working_directory=plain)
+    cases.append(("MacOSBuilder.execute_command[true]",
+                  lambda: builder.execute_command("true", capture_output=True, stream_output=False), None))
+
+    # Delta sync of one edited file; the first (full) push happens here
+    host_copy = root / "host" / "plain"
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.sync_files_to_host(plain + "/", str(host_copy) + "/")
+    edited = Path(plain) / "src" / "mod_0.rs"
+    edits = iter(range(1, 1 << 30))
+    cases.append(("MacOSBuilder.sync_files_to_host[one_change]",
+                  lambda: builder.sync_files_to_host(plain + "/", str(host_copy) + "/"),
+                  lambda: edited.write_text(f"pub fn f0() -> u32 {{ {next(edits)} }}\n")))
+    return cases
+
+
+def run_benchmarks(repeat=20, warmup=3, worktrees=10, refs=20000, only=None):
+    """
+    Build the fixtures in a temporary directory and run every case.
+
+    Args:
+        repeat (int): Timed calls per case
+        warmup (int): Untimed calls per case
+        worktrees (int): Linked worktrees in the worktree fixture
+        refs (int): Packed refs in the packed-refs fixture
+        only (str): Run only cases whose name contains this substring
+
+    Returns:
+        dict: {"meta": {...}, "results": {case name: measure() result}}
+    """
+    saved_env = dict(os.environ)
+    root = Path(tempfile.mkdtemp(prefix="claude-docker-bench-"))
+    try:
+        fake_log = install_fake_remote(root)
+        results = {}
+        for name, func, before_each in build_cases(root, worktrees, refs):
+            if only and only not in name:
+                continue
+            results[name] = measure(func, repeat, warmup, fake_log, before_each)
+    finally:
+        # Close fake masters while the fake ssh is still on PATH
+        for control_path, target in list(macos_builder._owned_masters.items()):
+            macos_builder._close_master(control_path, target)
+            macos_builder._owned_masters.pop(control_path, None)
+        os.environ.clear()
+        os.environ.update(saved_env)
+        macos_builder._build_config_memory_cache.clear()
+        shutil.rmtree(root, ignore_errors=True)
+
+    git_version = subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip()
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git": git_version,
+            "repeat": repeat,
+            "worktrees": worktrees,
+            "refs": refs,
+            "ssh_latency_ms": float(os.environ.get("BENCH_SSH_LATENCY_MS", "50")),
+            "ssh_mux_latency_ms": float(os.environ.get("BENCH_SSH_MUX_LATENCY_MS", "2"))
+        },
+        "results": results
+    }
+
+
+def compare_to_baseline(current, baseline, threshold=0.25, noise_floor_ms=NOISE_FLOOR_MS):
+    """
+    Compare a run against a baseline.
+
+    Args:
+        current (dict): run_benchmarks() result
+        baseline (dict): Earlier run_benchmarks() result
+        threshold (float): Allowed relative growth of the minimum time, the
+            figure least disturbed by other load on the machine
+        noise_floor_ms (float): Slowdowns smaller than this never fail
+
+    Returns:
+        list: One dict per case present in both (name, baseline_ms,
+              current_ms, change, subprocesses, regressions); regressions
+              lists the reasons the case failed, empty if it passed
+    """
+    comparison = []
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        regressions = []
+        slowdown = result["min_ms"] - before["min_ms"]
+        change = slowdown / before["min_ms"] if before["min_ms"] else 0.0
+        if change > threshold and slowdown > noise_floor_ms:
+            regressions.append(f"min {before['min_ms']:.2f} -> {result['min_ms']:.2f} ms (+{change:.0%})")
+        if result["subprocesses_per_call"] > before["subprocesses_per_call"]:
+            regressions.append(f"subprocesses {before['subprocesses_per_call']:g} -> {result['subprocesses_per_call']:g} per call")
+        comparison.append({
+            "name": name,
+            "baseline_ms": before["min_ms"],
+            "current_ms": result["min_ms"],
+            "change": round(change, 3),
+            "subprocesses": result["subprocesses_per_call"],
+            "regressions": regressions
+        })
+    return comparison
+
+
+def print_results(run, comparison=None):
+    """Print one line per case, with the baseline change when comparing."""
+    compared = {entry["name"]: entry for entry in comparison or []}
+    width = max((len(name) for name in run["results"]), default=0)
+    print(f"{'case':<{width}}  {'median':>10}  {'min':>10}  {'git':>5}  {'remote':>6}  {'vs baseline':>12}")
+    for name, result in run["results"].items():
+        entry = compared.get(name)
+        change = f"{entry['change']:+.0%}" if entry else "-"
+        marker = "  ❌ " + "; ".join(entry["regressions"]) if entry and entry["regressions"] else ""
+        print(f"{name:<{width}}  {result['median_ms']:>8.2f}ms  {result['min_ms']:>8.2f}ms  "
+              f"{result['git_per_call']:>5g}  {result['remote_per_call']:>6g}  {change:>12}{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark git and macOS build hot paths")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per case (default: 20)")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed calls per case (default: 3)")
+    parser.add_argument("--worktrees", type=int, default=10, help="Linked worktrees in the worktree repo (default: 10)")
+    parser.add_argument("--refs", type=int, default=20000, help="Packed refs in the packed-refs repo (default: 20000)")
+    parser.add_argument("--ssh-latency", type=float, help="Fake ssh handshake latency in ms (default: 50)")
+    parser.add_argument("--mux-latency", type=float, help="Fake multiplexed ssh/rsync latency in ms (default: 2)")
+    parser.add_argument("--only", help="Run only cases whose name contains this text")
+    parser.add_argument("--baseline", help=f"Baseline file (default: {get_default_baseline_path()})")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed relative slowdown of the minimum time before failing (default: 0.25)")
+    parser.add_argument("--noise-floor", type=float, default=NOISE_FLOOR_MS,
+                        help=f"Ignore slowdowns below this many ms (default: {NOISE_FLOOR_MS:g})")
+    parser.add_argument("--output", help="Also write this run's results to a JSON file")
+    parser.add_argument("--json", action="store_true", help="Print results (and comparison) as JSON")
+    args = parser.parse_args()
+
+    if args.ssh_latency is not None:
+        os.environ["BENCH_SSH_LATENCY_MS"] = str(args.ssh_latency)
+    if args.mux_latency is not None:
+        os.environ["BENCH_SSH_MUX_LATENCY_MS"] = str(args.mux_latency)
+
+    run = run_benchmarks(args.repeat, args.warmup, args.worktrees, args.refs, args.only)
+    if args.output:
+        Path(args.output).write_text(json.dumps(run, indent=2) + "\n")
+
+    baseline_path = Path(args.baseline) if args.baseline else get_default_baseline_path()
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(run, indent=2) + "\n")
+        comparison = None
+    elif baseline_path.exists():
+        comparison = compare_to_baseline(run, json.loads(baseline_path.read_text()), args.threshold, args.noise_floor)
+    else:
+        comparison = None
+
+    if args.json:
+        print(json.dumps({**run, "comparison": comparison}, indent=2))
+    else:
+        print_results(run, comparison)
+        if args.save_baseline:
+            print(f"\n💾 Baseline saved to {baseline_path}")
+        elif comparison is None:
+            print(f"\nNo baseline at {baseline_path}; run with --save-baseline to create one")
+
+    failed = [entry for entry in comparison or [] if entry["regressions"]]
+    if failed:
+        if not args.json:
+            print(f"\n❌ {len(failed)} case(s) regressed beyond {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""
+Host-wide coordinator for remote builds.
+
+Several claude-docker containers can drive the same Mac. With
+MACOS_COORDINATOR=true, macos_builder.py asks this coordinator for a slot
+before a configured command (or a command of `run`/`watch`, a `task` run
+or affected tests) starts on the host. The coordinator listens on a Unix
+socket in the scripts directory (~/.claude-docker/scripts on the host,
+mounted into every container):
+
+- Requests with the same key (command, host worktree and input
+  fingerprint; see compute_command_fingerprint) are coalesced: later
+  callers attach to the run in flight, receive its output and share its
+  exit code instead of starting their own.
+- At most MACOS_COORDINATOR_MAX_BUILDS runs are admitted host-wide. A free
+  slot goes to the session (one per container) that was served least
+  recently, so one busy session cannot starve the others.
+
+The coordinator never runs commands itself. The admitted caller (the
+leader) runs the command in its own container and streams the output
+back; if it goes away mid-run, an attached caller takes over. It is
+started on demand by the first request and exits after
+MACOS_COORDINATOR_IDLE seconds without work. It runs in the container
+that started it: when that container exits, the queues of all sessions
+are lost and their callers run their commands directly.
+
+Usage:
+    python3 build_coordinator.py serve
+    python3 build_coordinator.py status [--json]
+    python3 build_coordinator.py stop
+"""
+
+import argparse
+import asyncio
+import collections
+import fcntl
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Output lines kept per run for callers that attach late
+_BACKLOG_LINES = 200
+# Longest protocol message the coordinator accepts (an output line plus framing)
+_MESSAGE_LIMIT = 4 * 1024 * 1024
+# Seconds a client waits for a freshly started coordinator to listen
+_START_TIMEOUT = 3.0
+
+
+def get_socket_path():
+    """Get the coordinator socket path (MACOS_COORDINATOR_SOCKET, default: next to this script)."""
+    override = os.environ.get("MACOS_COORDINATOR_SOCKET")
+    if override:
+        return Path(os.path.expanduser(override))
+    return Path(__file__).resolve().parent / ".coordinator" / "coordinator.sock"
+
+
+def get_session_id():
+    """Identify this caller's session (MACOS_COORDINATOR_SESSION, default: the container's hostname)."""
+    return os.environ.get("MACOS_COORDINATOR_SESSION") or socket.gethostname()
+
+
+def is_coordinator_enabled():
+    """Check whether configured commands go through the coordinator."""
+    return os.environ.get("MACOS_COORDINATOR", "false").lower() == "true"
+
+
+# Daemon
+
+class _Client:
+    """One connection to the coordinator."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def send(self, event):
+        if not self.writer.is_closing():
+            self.writer.write((json.dumps(event) + "\n").encode())
+
+
+class _Run:
+    """A queued or running request and the callers attached to it."""
+
+    def __init__(self, key, session, label, leader):
+        self.key = key
+        self.session = session
+        self.label = label
+        self.leader = leader
+        self.followers = []
+        self.backlog = collections.deque(maxlen=_BACKLOG_LINES)
+        self.queued_at = time.time()
+        self.started_at = None
+
+    def describe(self):
+        return {
+            "label": self.label,
+            "session": self.session,
+            "attached": len(self.followers),
+            "seconds": round(time.time() - (self.started_at or self.queued_at), 1)
+        }
+
+
+class BuildCoordinator:
+    """
+    Queue, coalesce and admit remote runs.
+
+    Protocol: newline-delimited JSON. A client sends {"op": "request", "key",
+    "session", "label"} and receives "queued", "attached" (coalesced with a
+    run in flight), "run" (admitted: run the command now), "output" and
+    "done" events. The leader sends {"op": "output", "line"} for each line
+    and {"op": "done", "returncode", "summary"} at the end. {"op": "status"}
+    and {"op": "stop"} are answered directly.
+    """
+
+    def __init__(self, max_builds=2, idle_timeout=600):
+        self.max_builds = max_builds
+        self.idle_timeout = idle_timeout
+        self.running = []
+        # session -> queued runs, in order of arrival
+        self.queues = {}
+        # session -> turn it was last admitted in; the lowest goes next
+        self.last_served = {}
+        self.turn = 0
+        # coalescing key -> queued or running run
+        self.by_key = {}
+        self.connections = 0
+        self.last_activity = time.monotonic()
+        self.stopped = None
+
+    def status(self):
+        return {
+            "event": "status",
+            "pid": os.getpid(),
+            "limit": self.max_builds,
+            "running": [run.describe() for run in self.running],
+            "queued": [run.describe() for queue in self.queues.values() for run in queue]
+        }
+
+    def _queued_count(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _next_queued(self):
+        """Pop the oldest run of the session served least recently."""
+        if not self.queues:
+            return None
+        session = min(self.queues, key=lambda s: self.last_served.get(s, 0))
+        queue = self.queues[session]
+        run = queue.popleft()
+        if not queue:
+            del self.queues[session]
+        self.turn += 1
+        self.last_served[session] = self.turn
+        return run
+
+    def _admit(self):
+        while len(self.running) < self.max_builds:
+            run = self._next_queued()
+            if run is None:
+                break
+            run.started_at = time.time()
+            self.running.append(run)
+            run.leader.send({"event": "run"})
+
+    def _remove(self, run):
+        if run in self.running:
+            self.running.remove(run)
+        else:
+            queue = self.queues.get(run.session)
+            if queue and run in queue:
+                queue.remove(run)
+                if not queue:
+                    del self.queues[run.session]
+        if run.key and self.by_key.get(run.key) is run:
+            del self.by_key[run.key]
+        self._admit()
+
+    def _finish(self, run, message):
+        for follower in run.followers:
+            follower.send({"event": "done", "returncode": message.get("returncode"),
+                           "summary": message.get("summary")})
+        run.followers = []
+        self._remove(run)
+
+    def _leader_lost(self, run):
+        """Hand the run to an attached caller, or drop it."""
+        if not run.followers:
+            self._remove(run)
+            return
+        run.leader = run.followers.pop(0)
+        run.backlog.clear()
+        if run.started_at is not None:
+            # It keeps the slot and starts the command afresh
+            run.leader.send({"event": "run"})
+
+    def _request(self, client, message):
+        key = message.get("key")
+        run = self.by_key.get(key) if key else None
+        if run is not None:
+            run.followers.append(client)
+            client.send({"event": "attached", "label": run.label, "session": run.session,
+                         "running": run.started_at is not None})
+            for line in run.backlog:
+                client.send({"event": "output", "line": line})
+            return run
+
+        run = _Run(key, message.get("session") or "unknown", message.get("label") or key or "command", client)
+        if key:
+            self.by_key[key] = run
+        self.queues.setdefault(run.session, collections.deque()).append(run)
+        self._admit()
+        if run.started_at is None:
+            client.send({"event": "queued", "running": len(self.running), "limit": self.max_builds,
+                         "queued": self._queued_count()})
+        return run
+
+    async def handle(self, reader, writer):
+        """Serve one connection until the client closes it."""
+        client = _Client(reader, writer)
+        run = None
+        finished = False
+        self.connections += 1
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                op = message.get("op")
+                if op == "request" and run is None:
+                    run = self._request(client, message)
+                elif op == "output" and run is not None and run.leader is client:
+                    run.backlog.append(message.get("line", ""))
+                    for follower in run.followers:
+                        follower.send({"event": "output", "line": message.get("line", "")})
+                elif op == "done" and run is not None and run.leader is client:
+                    self._finish(run, message)
+                    finished = True
+                elif op == "status":
+                    client.send(self.status())
+                elif op == "stop":
+                    client.send({"event": "stopping"})
+                    self.stopped.set()
+                await writer.drain()
+        except (ValueError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            self.last_activity = time.monotonic()
+            if run is not None and not finished:
+                if run.leader is client:
+                    self._leader_lost(run)
+                elif client in run.followers:
+                    run.followers.remove(client)
+            writer.close()
+
+    async def serve(self, socket_path):
+        """Listen on socket_path until stopped or idle for idle_timeout seconds."""
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_unix_server(self.handle, path=str(socket_path), limit=_MESSAGE_LIMIT)
+        os.chmod(socket_path, 0o600)
+        async with server:
+            while not self.stopped.is_set():
+                try:
+                    await asyncio.wait_for(self.stopped.wait(), 10)
+                except asyncio.TimeoutError:
+                    idle = time.monotonic() - self.last_activity
+                    if not self.connections and idle > self.idle_timeout:
+                        break
+
+
+def serve(socket_path=None, max_builds=None, idle_timeout=None):
+    """
+    Run the coordinator in the foreground.
+
+    Returns at once if another coordinator holds the lock next to the socket.
+
+    Args:
+        socket_path (Path): Socket to listen on (default: get_socket_path())
+        max_builds (int): Host-wide concurrent runs (default: MACOS_COORDINATOR_MAX_BUILDS or 2)
+        idle_timeout (float): Seconds without work before exiting (default: MACOS_COORDINATOR_IDLE or 600)
+
+    Returns:
+        bool: False if another coordinator is already running
+    """
+    socket_path = Path(socket_path or get_socket_path())
+    max_builds = max_builds or int(os.environ.get("MACOS_COORDINATOR_MAX_BUILDS", "2"))
+    idle_timeout = idle_timeout or float(os.environ.get("MACOS_COORDINATOR_IDLE", "600"))
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(socket_path.with_suffix(".lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        # Left behind by a coordinator that did not exit cleanly
+        try:
+            socket_path.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            asyncio.run(BuildCoordinator(max(1, max_builds), idle_timeout).serve(socket_path))
+        finally:
+            try:
+                socket_path.unlink()
+            except FileNotFoundError:
+                pass
+    return True
+
+
+# Client
+
+def _connect(start=True):
+    """
+    Connect to the coordinator, starting it if nobody listens.
+
+    Args:
+        start (bool): Start a coordinator in the background if needed
+
+    Returns:
+        socket.socket or None: Connected socket, None if unreachable
+    """
+    socket_path = get_socket_path()
+
+    def attempt():
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(socket_path))
+            return sock
+        except OSError:
+            sock.close()
+            return None
+
+    sock = attempt()
+    if sock is not None or not start:
+        return sock
+
+    try:
+        socket_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(socket_path.with_suffix(".log"), "ab") as log:
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve"],
+                             stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                             start_new_session=True)
+    except OSError:
+        return None
+    deadline = time.monotonic() + _START_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        sock = attempt()
+        if sock is not None:
+            return sock
+    return None
+
+
+class BuildTicket:
+    """
+    A caller's place in the coordinator.
+
+    After request_build_slot returns, `role` is "leader" (run the command,
+    passing `forward` as an output listener, then call finish) or
+    "follower" (the coalesced run is over; `returncode` and `summary` hold
+    its result). A ticket closed without finish hands the run to a caller
+    attached to it.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile("rb")
+        self.role = None
+        self.returncode = None
+        self.summary = None
+        self._lock = threading.Lock()
+        self._broken = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _send(self, message):
+        if self._broken:
+            return
+        with self._lock:
+            try:
+                self.sock.sendall((json.dumps(message) + "\n").encode())
+            except OSError:
+                # The run goes on without the coordinator
+                self._broken = True
+
+    def wait(self, on_line=None):
+        """
+        Wait until this caller may run the command or the shared run is over.
+
+        Args:
+            on_line (callable): Receives each output line of a run this
+                caller is attached to
+        """
+        for raw in self.file:
+            event = json.loads(raw)
+            kind = event.get("event")
+            if kind == "queued":
+                print(f"⏳ Waiting for a host build slot ({event['running']}/{event['limit']} running, "
+                      f"{event['queued']} queued)", flush=True)
+            elif kind == "attached":
+                state = "running" if event["running"] else "queued"
+                print(f"🔗 {event['label']} is already {state} for session {event['session']}; "
+                      f"attaching to its output", flush=True)
+                self.role = "follower"
+            elif kind == "output":
+                if on_line:
+                    on_line(event["line"])
+            elif kind == "run":
+                if self.role == "follower":
+                    print("🔗 The attached run was abandoned; running it here", flush=True)
+                self.role = "leader"
+                return
+            elif kind == "done":
+                self.role = "follower"
+                self.returncode = event["returncode"]
+                self.summary = event.get("summary")
+                return
+        # Coordinator went away: run the command directly
+        self.role = None
+
+    def forward(self, line):
+        """Output listener for the leader: pass a line on to attached callers."""
+        self._send({"op": "output", "line": line})
+
+    def finish(self, returncode, summary=None):
+        """Report the leader's result to attached callers and free the slot."""
+        self._send({"op": "done", "returncode": returncode, "summary": summary})
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def request_build_slot(key, label, on_line=None, session=None, start=True):
+    """
+    Ask the coordinator to run a command, blocking until it is this caller's turn.
+
+    Args:
+        key (str): Coalescing key, or None to only take part in admission
+        label (str): Description shown to other sessions
+        on_line (callable): Receives output lines when attached to another run
+        session (str): Session id (default: get_session_id())
+        start (bool): Start the coordinator if it is not running
+
+    Returns:
+        BuildTicket or None: None when the coordinator is unreachable and
+            the caller should run the command directly
+    """
+    sock = _connect(start)
+    if sock is None:
+        return None
+    ticket = BuildTicket(sock)
+    ticket._send({"op": "request", "key": key, "session": session or get_session_id(), "label": label})
+    try:
+        ticket.wait(on_line)
+    except BaseException:
+        ticket.close()
+        raise
+    if ticket.role is None:
+        ticket.close()
+        return None
+    return ticket
+
+
+def query_coordinator(op="status"):
+    """
+    Send a one-off request (status, stop) to a running coordinator.
+
+    Returns:
+        dict or None: The reply, None if no coordinator is running
+    """
+    sock = _connect(start=False)
+    if sock is None:
+        return None
+    with sock, sock.makefile("rb") as reply:
+        sock.sendall((json.dumps({"op": op}) + "\n").encode())
+        line = reply.readline()
+    return json.loads(line) if line else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coordinate remote builds across claude-docker sessions")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    serve_parser = subparsers.add_parser("serve", help="Run the coordinator in the foreground")
+    serve_parser.add_argument("--max-builds", type=int, help="Host-wide concurrent runs (default: 2)")
+    serve_parser.add_argument("--idle-timeout", type=float, help="Exit after this many idle seconds (default: 600)")
+
+    status_parser = subparsers.add_parser("status", help="Show running and queued runs")
+    status_parser.add_argument("--json", action="store_true", help="Output as JSON")
+
+    subparsers.add_parser("stop", help="Stop the coordinator")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if not serve(max_builds=args.max_builds, idle_timeout=args.idle_timeout):
+            print(f"A coordinator is already running on {get_socket_path()}")
+
+    elif args.command == "status":
+        status = query_coordinator("status")
+        if args.json:
+            print(json.dumps(status, indent=2))
+        elif status is None:
+            print(f"No coordinator running on {get_socket_path()}")
+        else:
+            print(f"Coordinator (pid {status['pid']}): {len(status['running'])}/{status['limit']} running, "
+                  f"{len(status['queued'])} queued")
+            for state in ("running", "queued"):
+                for run in status[state]:
+                    attached = f", {run['attached']} attached" if run["attached"] else ""
+                    print(f"  {state:<8} {run['label']}  [{run['session']}]  {run['seconds']:.0f}s{attached}")
+
+    elif args.command == "stop":
+        print("Coordinator stopped" if query_coordinator("stop") else "No coordinator running")
+
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,40 @@
 import subprocess
 import os
 import json
+import sys
+import time
+import hashlib
+import asyncio
+import threading
+import weakref
 from pathlib import Path
 
-def run_git_command(args, cwd=None, capture_output=True, text=True):
+# Number of git subprocesses started by run_git_command in this process
+_git_command_count = 0
+
+# Maximum git subprocesses running at once per event loop in the async API
+_git_max_concurrency = int(os.environ.get("CLAUDE_GIT_MAX_CONCURRENCY", "8"))
+_git_semaphores = weakref.WeakKeyDictionary()
+
+# Event loop reused by the sync wrappers, one per thread
+_sync_loops = threading.local()
+
+# Flags for the single batched rev-parse used by probe_git_repo. rev-parse
+# prints one line per flag and stops at the first one that fails, so the
+# order matters: repository-level facts come first, then the ones that
+# need a work tree (--show-toplevel) or a born branch (HEAD).
+_PROBE_REV_PARSE_ARGS = [
+    "rev-parse",
+    "--absolute-git-dir",
+    "--git-common-dir",
+    "--is-bare-repository",
+    "--is-inside-work-tree",
+    "--show-toplevel",
+    "HEAD",
+    "--symbolic-full-name", "HEAD",
+]
+
+def run_git_command(args, cwd=None, capture_output=True, text=True, input=None):
     """
     Run a git command and return the result.
     
@@ -12,178 +43,277 @@ def run_git_command(args, cwd=None, capture_output=True, text=True):
         cwd (str, optional): Working directory for the command
         capture_output (bool): Whether to capture output
         text (bool): Whether to decode output as text
+        input (str, optional): Data written to the command's stdin
     
     Returns:
         subprocess.CompletedProcess: Result of the git command
     """
+    global _git_command_count
+    
     if cwd is None:
         cwd = os.getcwd()
     
+    _git_command_count += 1
     try:
         return subprocess.run(
             ["git"] + args,
             cwd=cwd,
             capture_output=capture_output,
             text=text,
+            input=input,
             check=False
         )
     except FileNotFoundError:
         return None
 
-def is_git_repo(path=None):
+def get_git_command_count():
     """
-    Check if the given path (or current directory) is inside a git repository.
+    Get the number of git subprocesses started so far by this process.
+    
+    Returns:
+        int: Number of run_git_command invocations
+    """
+    return _git_command_count
+
+def set_git_concurrency_limit(limit):
+    """
+    Set how many git subprocesses the async API runs at once.
     
     Args:
-        path (str, optional): Path to check. Defaults to current directory.
+        limit (int): Maximum concurrent git processes per event loop
+    """
+    global _git_max_concurrency
+    
+    _git_max_concurrency = limit
+    _git_semaphores.clear()
+
+def _get_git_semaphore():
+    """
+    Get the concurrency-limiting semaphore for the running event loop.
     
     Returns:
-        bool: True if inside a git repository
+        asyncio.Semaphore: Semaphore sized by set_git_concurrency_limit
     """
-    if path is None:
-        path = os.getcwd()
+    loop = asyncio.get_running_loop()
+    semaphore = _git_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _git_semaphores[loop] = asyncio.Semaphore(_git_max_concurrency)
+    return semaphore
+
+async def async_run_git_command(args, cwd=None, timeout=None):
+    """
+    Run a git command without blocking the event loop.
+    
+    At most CLAUDE_GIT_MAX_CONCURRENCY (default 8) git processes run at once
+    per event loop. On timeout or cancellation the process is killed.
+    
+    Args:
+        args (list): Git command arguments
+        cwd (str, optional): Working directory for the command
+        timeout (float, optional): Seconds before the command is killed
+    
+    Returns:
+        subprocess.CompletedProcess: Result with text stdout/stderr, or None
+                                     if git (or cwd) does not exist
+    
+    Raises:
+        subprocess.TimeoutExpired: If the command exceeded timeout
+    """
+    global _git_command_count
+    
+    if cwd is None:
+        cwd = os.getcwd()
+    
+    async with _get_git_semaphore():
+        _git_command_count += 1
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "git", *args,
+                cwd=cwd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            return None
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise subprocess.TimeoutExpired(["git"] + args, timeout)
+        except asyncio.CancelledError:
+            process.kill()
+            raise
     
-    result = run_git_command(["rev-parse", "--git-dir"], cwd=path)
-    return result is not None and result.returncode == 0
+    return subprocess.CompletedProcess(
+        ["git"] + args,
+        process.returncode,
+        stdout.decode("utf-8", errors="replace"),
+        stderr.decode("utf-8", errors="replace")
+    )
 
-def is_git_worktree(path=None):
+def _run_sync(coro):
     """
-    Check if the given path (or current directory) is a git worktree.
+    Run a coroutine to completion from synchronous code.
+    
+    Reuses one event loop per thread. When called from inside a running
+    event loop, the coroutine runs on a helper thread instead. On Ctrl-C the
+    coroutine is cancelled and allowed to clean up (e.g. stop the processes
+    it started) before KeyboardInterrupt propagates.
     
     Args:
-        path (str, optional): Path to check. Defaults to current directory.
+        coro (coroutine): Coroutine to run
     
     Returns:
-        bool: True if this is a git worktree (not the main repository)
+        object: The coroutine's result
     """
-    if path is None:
-        path = os.getcwd()
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        loop = getattr(_sync_loops, "loop", None)
+        if loop is None or loop.is_closed():
+            loop = _sync_loops.loop = asyncio.new_event_loop()
+        task = loop.create_task(coro)
+        try:
+            return loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except (asyncio.CancelledError, Exception):
+                pass
+            raise
     
-    if not is_git_repo(path):
-        return False
+    from concurrent.futures import ThreadPoolExecutor
     
-    # Check if .git is a file (worktree) or directory (main repo)
-    git_dir_result = run_git_command(["rev-parse", "--git-dir"], cwd=path)
-    if git_dir_result is None or git_dir_result.returncode != 0:
-        return False
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(_run_sync, coro).result()
+
+def _is_object_id(value):
+    """
+    Check whether a string is a full SHA-1 or SHA-256 object id.
     
-    git_dir = git_dir_result.stdout.strip()
-    git_path = Path(path) / ".git"
+    Args:
+        value (str): String to check
     
-    # If .git is a file, this is likely a worktree
-    if git_path.exists() and git_path.is_file():
-        return True
+    Returns:
+        bool: True if value looks like an object id
+    """
+    return len(value) in (40, 64) and all(c in "0123456789abcdef" for c in value)
+
+def probe_git_repo(path=None):
+    """
+    Collect the basic facts about a repository with a single git process.
     
-    # Alternative check: see if we're in a worktree using git worktree list
-    worktree_result = run_git_command(["worktree", "list", "--porcelain"], cwd=path)
-    if worktree_result is None or worktree_result.returncode != 0:
-        return False
+    Synchronous wrapper around async_probe_git_repo.
     
-    current_path = Path(path).resolve()
-    for line in worktree_result.stdout.splitlines():
-        if line.startswith("worktree "):
-            worktree_path = Path(line.split(" ", 1)[1]).resolve()
-            if worktree_path == current_path:
-                return True
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
     
-    return False
+    Returns:
+        dict: Probe results (see async_probe_git_repo)
+    """
+    return _run_sync(async_probe_git_repo(path))
 
-def get_git_repo_info(path=None):
+async def async_probe_git_repo(path=None, timeout=None):
     """
-    Get comprehensive information about the git repository.
+    Collect the basic facts about a repository with a single git process.
+    
+    All flags are passed to one `git rev-parse` call. Missing lines at the
+    end of its output mean the corresponding query failed (bare repository,
+    cwd inside .git, or a branch with no commits yet).
     
     Args:
         path (str, optional): Path to check. Defaults to current directory.
+        timeout (float, optional): Per-command timeout in seconds
     
     Returns:
-        dict: Repository information including:
+        dict: Probe results including:
             - is_repo: bool
-            - is_worktree: bool
+            - git_dir: str (absolute path of this worktree's git directory)
+            - common_dir: str (absolute path of the shared git directory)
+            - is_bare: bool
+            - inside_work_tree: bool
             - root_path: str (repository root)
-            - current_branch: str
-            - remote_url: str
             - commit_hash: str
-            - worktree_info: dict (if applicable)
+            - current_branch: str ("" when HEAD is detached)
     """
     if path is None:
         path = os.getcwd()
     
-    info = {
+    probe = {
         "is_repo": False,
-        "is_worktree": False,
+        "git_dir": None,
+        "common_dir": None,
+        "is_bare": False,
+        "inside_work_tree": False,
         "root_path": None,
-        "current_branch": None,
-        "remote_url": None,
         "commit_hash": None,
-        "worktree_info": None
+        "current_branch": None
     }
     
-    # Check if this is a git repository
-    if not is_git_repo(path):
-        return info
+    result = await async_run_git_command(_PROBE_REV_PARSE_ARGS, cwd=path, timeout=timeout)
+    if result is None:
+        return probe
     
-    info["is_repo"] = True
-    info["is_worktree"] = is_git_worktree(path)
+    lines = result.stdout.splitlines()
+    if not lines:
+        return probe
     
-    # Get repository root
-    root_result = run_git_command(["rev-parse", "--show-toplevel"], cwd=path)
-    if root_result and root_result.returncode == 0:
-        info["root_path"] = root_result.stdout.strip()
+    # Pad so that every failed trailing query reads as None
+    lines += [None] * (7 - len(lines))
+    git_dir, common_dir, is_bare, inside_work_tree, root_path, commit_hash, head_ref = lines[:7]
     
-    # Get current branch
-    branch_result = run_git_command(["branch", "--show-current"], cwd=path)
-    if branch_result and branch_result.returncode == 0:
-        info["current_branch"] = branch_result.stdout.strip()
+    probe["is_repo"] = True
+    probe["git_dir"] = git_dir
+    if common_dir:
+        probe["common_dir"] = os.path.abspath(os.path.join(path, common_dir))
+    probe["is_bare"] = is_bare == "true"
+    probe["inside_work_tree"] = inside_work_tree == "true"
+    probe["root_path"] = root_path
     
-    # Get remote URL
-    remote_result = run_git_command(["remote", "get-url", "origin"], cwd=path)
-    if remote_result and remote_result.returncode == 0:
-        info["remote_url"] = remote_result.stdout.strip()
+    if root_path is None and inside_work_tree != "true":
+        # --show-toplevel failed (bare repository or inside .git), so HEAD
+        # was never reached; ask for it separately
+        head_result = await async_run_git_command(["rev-parse", "HEAD", "--symbolic-full-name", "HEAD"], cwd=path, timeout=timeout)
+        head_lines = head_result.stdout.splitlines() if head_result else []
+        head_lines += [None] * (2 - len(head_lines))
+        commit_hash, head_ref = head_lines[:2]
     
-    # Get current commit hash
-    commit_result = run_git_command(["rev-parse", "HEAD"], cwd=path)
-    if commit_result and commit_result.returncode == 0:
-        info["commit_hash"] = commit_result.stdout.strip()
+    # rev-parse echoes an unresolvable HEAD back instead of a hash
+    if commit_hash is not None and not _is_object_id(commit_hash):
+        commit_hash, head_ref = None, None
+    probe["commit_hash"] = commit_hash
     
-    # Get worktree information if applicable
-    if info["is_worktree"]:
-        info["worktree_info"] = get_worktree_info(path)
+    if head_ref is not None:
+        # A detached HEAD resolves to "HEAD" itself
+        probe["current_branch"] = head_ref[len("refs/heads/"):] if head_ref.startswith("refs/heads/") else ""
+    else:
+        # Unborn branch: HEAD did not resolve, but it can still name a branch
+        branch_result = await async_run_git_command(["symbolic-ref", "--short", "-q", "HEAD"], cwd=path, timeout=timeout)
+        if branch_result and branch_result.returncode == 0:
+            probe["current_branch"] = branch_result.stdout.strip()
+        elif branch_result is not None:
+            probe["current_branch"] = ""
     
-    return info
+    return probe
 
-def get_worktree_info(path=None):
+def parse_worktree_list(output, details=False):
     """
-    Get detailed information about git worktrees.
+    Parse the output of `git worktree list --porcelain`.
     
     Args:
-        path (str, optional): Path to check. Defaults to current directory.
+        output (str): Porcelain output
+        details (bool): Also record locked/prunable state (with reasons)
     
     Returns:
-        dict: Worktree information including:
-            - main_worktree: str (path to main worktree)
-            - all_worktrees: list (all worktrees)
-            - current_worktree: dict (current worktree info)
+        list: Worktree dicts with path, commit, branch and bare/detached flags
     """
-    if path is None:
-        path = os.getcwd()
-    
-    worktree_info = {
-        "main_worktree": None,
-        "all_worktrees": [],
-        "current_worktree": None
-    }
-    
-    # Get worktree list
-    worktree_result = run_git_command(["worktree", "list", "--porcelain"], cwd=path)
-    if worktree_result is None or worktree_result.returncode != 0:
-        return worktree_info
-    
-    current_path = Path(path).resolve()
     worktrees = []
     current_worktree = {}
     
-    # Parse worktree list output
-    for line in worktree_result.stdout.splitlines():
+    for line in output.splitlines():
         if line.startswith("worktree "):
             if current_worktree:
                 worktrees.append(current_worktree)
@@ -196,85 +326,2015 @@ def get_worktree_info(path=None):
             current_worktree["bare"] = True
         elif line.startswith("detached"):
             current_worktree["detached"] = True
+        elif details and line.startswith("locked"):
+            current_worktree["locked"] = line[len("locked "):]
+        elif details and line.startswith("prunable"):
+            current_worktree["prunable"] = line[len("prunable "):]
     
     # Add the last worktree
     if current_worktree:
         worktrees.append(current_worktree)
     
-    worktree_info["all_worktrees"] = worktrees
+    return worktrees
+
+def list_worktrees(path=None, details=False):
+    """
+    List all worktrees of the repository containing path.
+    
+    Synchronous wrapper around async_list_worktrees.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+        details (bool): Also record locked/prunable state
+    
+    Returns:
+        list: Parsed worktrees, or None if the listing failed
+    """
+    return _run_sync(async_list_worktrees(path, details))
+
+async def async_list_worktrees(path=None, details=False, timeout=None):
+    """
+    List all worktrees of the repository containing path.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+        details (bool): Also record locked/prunable state
+        timeout (float, optional): Command timeout in seconds
+    
+    Returns:
+        list: Parsed worktrees, or None if the listing failed
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    worktree_result = await async_run_git_command(["worktree", "list", "--porcelain"], cwd=path, timeout=timeout)
+    if worktree_result is None or worktree_result.returncode != 0:
+        return None
+    
+    return parse_worktree_list(worktree_result.stdout, details)
+
+class WorktreeRegistry:
+    """
+    Parsed worktree list indexed by resolved path and by branch.
+    
+    Build it once per repository and query it repeatedly: path and branch
+    lookups are dictionary hits instead of a scan over every worktree.
+    """
+    
+    def __init__(self, worktrees):
+        """
+        Index a parsed worktree list.
+        
+        Args:
+            worktrees (list): Worktrees from list_worktrees or read_git_metadata
+                              (the main worktree first)
+        """
+        self.worktrees = worktrees or []
+        self.by_path = {}
+        self.by_branch = {}
+        
+        for wt in self.worktrees:
+            self.by_path.setdefault(os.path.realpath(wt["path"]), wt)
+            if wt.get("branch"):
+                self.by_branch.setdefault(wt["branch"], wt)
+    
+    def __len__(self):
+        return len(self.worktrees)
+    
+    @property
+    def main_worktree(self):
+        """dict: The main worktree, or None for an empty registry."""
+        return self.worktrees[0] if self.worktrees else None
+    
+    def get(self, path):
+        """
+        Get the worktree rooted exactly at path.
+        
+        Args:
+            path (str): Worktree root
+        
+        Returns:
+            dict: Worktree entry, or None
+        """
+        return self.by_path.get(os.path.realpath(path))
+    
+    def find_by_path(self, path):
+        """
+        Find the worktree containing path (the innermost one if nested).
+        
+        Args:
+            path (str): Any path inside a worktree
+        
+        Returns:
+            dict: Worktree entry, or None
+        """
+        current = os.path.realpath(path)
+        while True:
+            wt = self.by_path.get(current)
+            if wt is not None:
+                return wt
+            parent = os.path.dirname(current)
+            if parent == current:
+                return None
+            current = parent
     
-    # Find main worktree and current worktree
-    for wt in worktrees:
-        wt_path = Path(wt["path"]).resolve()
+    def find_by_branch(self, branch):
+        """
+        Find the worktree that has a branch checked out.
         
-        # Main worktree is typically the first one or the one without a separate .git file
-        if worktree_info["main_worktree"] is None:
-            worktree_info["main_worktree"] = wt["path"]
+        Args:
+            branch (str): Branch name, with or without refs/heads/
         
-        # Check if this is the current worktree
-        if wt_path == current_path:
-            worktree_info["current_worktree"] = wt
+        Returns:
+            dict: Worktree entry, or None
+        """
+        if branch.startswith("refs/heads/"):
+            branch = branch[len("refs/heads/"):]
+        return self.by_branch.get(branch)
     
-    return worktree_info
+    def list(self):
+        """
+        List every worktree with its full state.
+        
+        Returns:
+            list: Dicts with path, commit, branch, detached, bare, is_main,
+                  locked, lock_reason, prunable and prunable_reason
+        """
+        main = self.main_worktree
+        return [{
+            "path": wt["path"],
+            "commit": wt.get("commit"),
+            "branch": wt.get("branch"),
+            "detached": wt.get("detached", False),
+            "bare": wt.get("bare", False),
+            "is_main": wt is main,
+            "locked": "locked" in wt,
+            "lock_reason": wt.get("locked") or None,
+            "prunable": "prunable" in wt,
+            "prunable_reason": wt.get("prunable") or None
+        } for wt in self.worktrees]
 
-def get_git_status_env_vars(path=None):
+def get_worktree_registry(path=None):
     """
-    Get git repository information formatted as environment variables.
+    Build a WorktreeRegistry for the repository containing path.
     
     Args:
         path (str, optional): Path to check. Defaults to current directory.
     
     Returns:
-        dict: Environment variables for git status
+        WorktreeRegistry: Registry (empty if path is not in a repository)
     """
-    info = get_git_repo_info(path)
+    if path is None:
+        path = os.getcwd()
     
-    env_vars = {
-        "CLAUDE_GIT_IS_REPO": "true" if info["is_repo"] else "false",
-        "CLAUDE_GIT_IS_WORKTREE": "true" if info["is_worktree"] else "false",
-        "CLAUDE_GIT_ROOT_PATH": info["root_path"] or "",
-        "CLAUDE_GIT_CURRENT_BRANCH": info["current_branch"] or "",
-        "CLAUDE_GIT_REMOTE_URL": info["remote_url"] or "",
-        "CLAUDE_GIT_COMMIT_HASH": info["commit_hash"] or ""
+    metadata = read_git_metadata(path, remote=False, worktree_details=True)
+    if metadata is not None:
+        return WorktreeRegistry(metadata.get("worktrees"))
+    
+    return WorktreeRegistry(list_worktrees(path, details=True))
+
+def build_worktree_info(worktrees, path):
+    """
+    Build the get_worktree_info dict from an already parsed worktree list.
+    
+    Args:
+        worktrees (list or WorktreeRegistry): Worktrees from list_worktrees
+        path (str): Path whose worktree should be reported as current
+    
+    Returns:
+        dict: Worktree information (see get_worktree_info)
+    """
+    registry = worktrees if isinstance(worktrees, WorktreeRegistry) else WorktreeRegistry(worktrees)
+    
+    return {
+        "main_worktree": registry.main_worktree["path"] if registry.main_worktree else None,
+        "all_worktrees": registry.worktrees,
+        "current_worktree": registry.get(path)
     }
+
+def _needs_worktree_list(path, probe):
+    """
+    Decide whether path can be a worktree at all, to avoid listing worktrees
+    for plain subdirectories.
     
-    # Add worktree-specific environment variables
-    if info["is_worktree"] and info["worktree_info"]:
-        wt_info = info["worktree_info"]
-        env_vars.update({
-            "CLAUDE_GIT_MAIN_WORKTREE": wt_info["main_worktree"] or "",
-            "CLAUDE_GIT_WORKTREE_COUNT": str(len(wt_info["all_worktrees"])),
-            "CLAUDE_GIT_CURRENT_WORKTREE_BRANCH": wt_info["current_worktree"].get("branch", "") if wt_info["current_worktree"] else ""
-        })
+    Args:
+        path (str): Path being checked
+        probe (dict): Result of probe_git_repo
     
-    return env_vars
+    Returns:
+        bool: True if the worktree list must be consulted
+    """
+    if not probe["is_repo"]:
+        return False
+    
+    git_path = Path(path) / ".git"
+    if git_path.is_file():
+        return True
+    
+    # Worktree paths are work tree roots, so only the root can match one
+    if probe["root_path"] is None:
+        return True
+    return Path(path).resolve() == Path(probe["root_path"]).resolve()
 
-def export_git_env_vars(path=None):
+def _is_worktree(path, worktrees):
     """
-    Export git repository information as environment variables.
-    Prints export statements that can be sourced by shell.
+    Apply the worktree test to a path given its worktree list.
     
     Args:
-        path (str, optional): Path to check. Defaults to current directory.
+        path (str): Path being checked
+        worktrees (list or WorktreeRegistry): Worktrees from list_worktrees
+    
+    Returns:
+        bool: True if path is a git worktree
     """
-    env_vars = get_git_status_env_vars(path)
+    # If .git is a file, this is likely a worktree
+    git_path = Path(path) / ".git"
+    if git_path.exists() and git_path.is_file():
+        return True
     
-    for key, value in env_vars.items():
-        print(f'export {key}="{value}"')
+    if not worktrees:
+        return False
+    
+    registry = worktrees if isinstance(worktrees, WorktreeRegistry) else WorktreeRegistry(worktrees)
+    return registry.get(path) is not None
 
-if __name__ == "__main__":
-    # Command line interface for testing
-    import sys
+# Environment variables that change how git discovers or configures a
+# repository; when any is set the fast path defers to the git CLI
+_FAST_PATH_UNSAFE_ENV = (
+    "GIT_DIR", "GIT_WORK_TREE", "GIT_COMMON_DIR", "GIT_CEILING_DIRECTORIES",
+    "GIT_DISCOVERY_ACROSS_FILESYSTEM", "GIT_CONFIG", "GIT_CONFIG_GLOBAL",
+    "GIT_CONFIG_SYSTEM", "GIT_CONFIG_NOSYSTEM", "GIT_CONFIG_COUNT",
+    "GIT_CONFIG_PARAMETERS", "GIT_NAMESPACE",
+)
+
+# Repository extensions that do not affect how refs, HEAD and worktrees are
+# stored on disk
+_FAST_PATH_SAFE_EXTENSIONS = {
+    "noop", "objectformat", "worktreeconfig", "preciousobjects",
+    "partialclone", "relativeworktrees",
+}
+
+def is_fast_path_enabled():
+    """
+    Check whether git metadata may be read directly from .git files.
     
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
-        path = sys.argv[2] if len(sys.argv) > 2 else None
+    Disabled by setting CLAUDE_GIT_FAST_PATH=false.
+    
+    Returns:
+        bool: True if the subprocess-free reader should be tried first
+    """
+    return os.environ.get("CLAUDE_GIT_FAST_PATH", "true").lower() != "false"
+
+def _read_text(file_path):
+    """
+    Read a small metadata file.
+    
+    Args:
+        file_path (str): File to read
+    
+    Returns:
+        str: Stripped file contents, or None if it cannot be read
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def _parse_config_value(raw):
+    """
+    Decode a git config value: strip comments and quotes, expand escapes.
+    
+    Args:
+        raw (str): Text after the '=' sign
+    
+    Returns:
+        str: Decoded value
+    """
+    value = []
+    in_quotes = False
+    i = 0
+    while i < len(raw):
+        c = raw[i]
+        if c == '"':
+            in_quotes = not in_quotes
+        elif c == "\\" and i + 1 < len(raw):
+            i += 1
+            value.append({"n": "\n", "t": "\t", "b": "\b"}.get(raw[i], raw[i]))
+        elif c in "#;" and not in_quotes:
+            break
+        else:
+            value.append(c)
+        i += 1
+    return "".join(value).strip()
+
+def parse_git_config(config_path, _depth=0):
+    """
+    Parse a git config file, following plain [include] directives.
+    
+    Args:
+        config_path (str): Path to the config file
+    
+    Returns:
+        list: (section, subsection, key, value) tuples in file order, with
+              section and key lowercased; [] if the file does not exist,
+              or None if it uses includeIf (which the fast path cannot
+              evaluate)
+    """
+    text = _read_text(config_path)
+    if text is None:
+        return []
+    if _depth > 10:
+        return None
+    
+    entries = []
+    section, subsection = None, None
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+        # Join continuation lines
+        while line.endswith("\\") and i + 1 < len(lines):
+            i += 1
+            line = line[:-1] + lines[i].strip()
+        i += 1
         
-        if command == "info":
-            info = get_git_repo_info(path)
-            print(json.dumps(info, indent=2))
-        elif command == "json":
-            info = get_git_repo_info(path)
+        if not line or line[0] in "#;":
+            continue
+        
+        if line.startswith("["):
+            header, _, rest = line[1:].partition("]")
+            if '"' in header:
+                name, _, sub = header.partition('"')
+                section = name.strip().lower()
+                subsection = sub.rsplit('"', 1)[0].replace('\\"', '"').replace("\\\\", "\\")
+            elif "." in header:
+                # Deprecated [section.subsection] form
+                section, _, subsection = header.strip().partition(".")
+                section, subsection = section.lower(), subsection.lower()
+            else:
+                section, subsection = header.strip().lower(), None
+            if section == "includeif":
+                return None
+            line = rest.strip()
+            if not line or line[0] in "#;":
+                continue
+        
+        key, sep, raw_value = line.partition("=")
+        key = key.strip().lower()
+        value = _parse_config_value(raw_value) if sep else "true"
+        
+        if section == "include" and key == "path":
+            include_path = os.path.expanduser(value)
+            if not os.path.isabs(include_path):
+                include_path = os.path.join(os.path.dirname(config_path), include_path)
+            included = parse_git_config(include_path, _depth + 1)
+            if included is None:
+                return None
+            entries.extend(included)
+        else:
+            entries.append((section, subsection, key, value))
+    
+    return entries
+
+def _get_global_config_paths():
+    """
+    Get the system and global config files git reads, in precedence order.
+    
+    Returns:
+        list: Config file paths
+    """
+    home = os.path.expanduser("~")
+    xdg_config = os.environ.get("XDG_CONFIG_HOME") or os.path.join(home, ".config")
+    return [
+        "/etc/gitconfig",
+        os.path.join(xdg_config, "git", "config"),
+        os.path.join(home, ".gitconfig"),
+    ]
+
+def _is_owned_by_current_user(*paths):
+    """
+    Check ownership the way git's safe.directory protection does.
+    
+    Args:
+        *paths (str): Paths to check
+    
+    Returns:
+        bool: True if every path is owned by the effective user
+    """
+    if not hasattr(os, "geteuid"):
+        return True
+    
+    uid = os.geteuid()
+    for p in paths:
+        try:
+            if os.stat(p).st_uid != uid:
+                return False
+        except OSError:
+            return False
+    return True
+
+def _resolve_git_file(dot_git_file):
+    """
+    Follow a "gitdir: <path>" pointer file.
+    
+    Args:
+        dot_git_file (str): Path of the .git file (or a worktrees/*/gitdir file)
+    
+    Returns:
+        str: Absolute path it points to, or None if malformed
+    """
+    content = _read_text(dot_git_file)
+    if not content:
+        return None
+    if content.startswith("gitdir:"):
+        content = content[len("gitdir:"):].strip()
+    target = os.path.join(os.path.dirname(dot_git_file), content)
+    return os.path.normpath(target)
+
+def _discover_git_dir(path):
+    """
+    Walk up from path to the enclosing repository, like git's discovery.
+    
+    Args:
+        path (str): Starting directory
+    
+    Returns:
+        dict: {"root_path", "git_dir", "common_dir"}, {} when path is not in
+              a repository, or None when the layout needs the git CLI
+              (bare repository, inside .git, filesystem boundary, ...)
+    """
+    current = os.path.abspath(path)
+    if ".git" in current.split(os.sep):
+        return None
+    
+    try:
+        device = os.stat(current).st_dev
+    except OSError:
+        return None
+    
+    while True:
+        dot_git = os.path.join(current, ".git")
+        if os.path.isfile(dot_git):
+            git_dir = _resolve_git_file(dot_git)
+            if git_dir is None or not os.path.isfile(os.path.join(git_dir, "HEAD")):
+                return None
+            if not _is_owned_by_current_user(current, dot_git, git_dir):
+                return None
+            break
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+            if not os.path.isfile(os.path.join(git_dir, "HEAD")):
+                return None
+            if not _is_owned_by_current_user(current, git_dir):
+                return None
+            break
+        if os.path.isfile(os.path.join(current, "HEAD")) and os.path.isdir(os.path.join(current, "objects")):
+            # A bare repository (or a git directory itself)
+            return None
+        
+        parent = os.path.dirname(current)
+        if parent == current:
+            return {}
+        try:
+            if os.stat(parent).st_dev != device:
+                # git stops discovery at filesystem boundaries
+                return None
+        except OSError:
+            return None
+        current = parent
+    
+    git_dir = os.path.realpath(git_dir)
+    common_dir = git_dir
+    commondir_pointer = _read_text(os.path.join(git_dir, "commondir"))
+    if commondir_pointer:
+        common_dir = os.path.realpath(os.path.join(git_dir, commondir_pointer))
+    
+    return {
+        "root_path": os.path.realpath(current),
+        "git_dir": git_dir,
+        "common_dir": common_dir
+    }
+
+def _read_packed_refs(common_dir):
+    """
+    Load packed-refs into a dict.
+    
+    Args:
+        common_dir (str): Shared git directory
+    
+    Returns:
+        dict: Ref name -> object id
+    """
+    refs = {}
+    text = _read_text(os.path.join(common_dir, "packed-refs"))
+    if not text:
+        return refs
+    
+    for line in text.splitlines():
+        if not line or line[0] in "#^":
+            continue
+        object_id, _, ref_name = line.partition(" ")
+        refs[ref_name.strip()] = object_id
+    return refs
+
+def _ref_file_path(git_dir, common_dir, ref_name):
+    """
+    Locate the loose file for a ref.
+    
+    Args:
+        git_dir (str): Worktree git directory
+        common_dir (str): Shared git directory
+        ref_name (str): Full ref name (refs/heads/...)
+    
+    Returns:
+        str: Path of the loose ref file (which may not exist)
+    """
+    # Per-worktree refs live in the worktree's git dir, the rest are shared
+    if ref_name.startswith(("refs/bisect/", "refs/worktree/", "refs/rewritten/")):
+        return os.path.join(git_dir, ref_name)
+    return os.path.join(common_dir, ref_name)
+
+def _resolve_head(git_dir, common_dir, packed_refs):
+    """
+    Resolve a HEAD file to its branch ref and commit.
+    
+    Args:
+        git_dir (str): Git directory holding the HEAD file
+        common_dir (str): Shared git directory holding refs
+        packed_refs (dict): Result of _read_packed_refs
+    
+    Returns:
+        tuple: (ref_name or None when detached, commit hash or None when unborn)
+    """
+    content = _read_text(os.path.join(git_dir, "HEAD"))
+    if content is None:
+        return None, None
+    
+    head_ref = None
+    # Follow symbolic refs (bounded, as git does)
+    for _ in range(5):
+        if not content.startswith("ref:"):
+            return head_ref, content if _is_object_id(content) else None
+        ref_name = content[len("ref:"):].strip()
+        if head_ref is None:
+            head_ref = ref_name
+        content = _read_text(_ref_file_path(git_dir, common_dir, ref_name))
+        if content is None:
+            return head_ref, packed_refs.get(ref_name)
+    return head_ref, None
+
+def _read_worktrees(common_dir, packed_refs, null_oid="0" * 40, details=False):
+    """
+    Build the `git worktree list` entries from the worktrees directory.
+    
+    Args:
+        common_dir (str): Shared git directory
+        packed_refs (dict): Result of _read_packed_refs
+        null_oid (str): Object id git reports for an unborn HEAD
+        details (bool): Also record locked/prunable state
+    
+    Returns:
+        list: Worktrees in the same shape as list_worktrees, or None if the
+              layout needs the git CLI
+    """
+    def make_entry(wt_path, wt_git_dir):
+        entry = {"path": wt_path}
+        head_ref, commit = _resolve_head(wt_git_dir, common_dir, packed_refs)
+        entry["commit"] = commit or null_oid
+        if head_ref is None:
+            entry["detached"] = True
+        else:
+            entry["branch"] = head_ref.replace("refs/heads/", "")
+        return entry
+    
+    if os.path.basename(common_dir) != ".git":
+        return None
+    worktrees = [make_entry(os.path.dirname(common_dir), common_dir)]
+    
+    linked = []
+    worktrees_dir = os.path.join(common_dir, "worktrees")
+    try:
+        ids = os.listdir(worktrees_dir)
+    except FileNotFoundError:
+        ids = []
+    except OSError:
+        return None
+    
+    for wt_id in ids:
+        wt_git_dir = os.path.join(worktrees_dir, wt_id)
+        gitdir_pointer = _resolve_git_file(os.path.join(wt_git_dir, "gitdir"))
+        if gitdir_pointer is None:
+            return None
+        wt_path = gitdir_pointer[:-len("/.git")] if gitdir_pointer.endswith("/.git") else gitdir_pointer
+        entry = make_entry(wt_path, wt_git_dir)
+        if details:
+            lock_reason = _read_text(os.path.join(wt_git_dir, "locked"))
+            if lock_reason is not None:
+                entry["locked"] = lock_reason
+            elif not os.path.exists(gitdir_pointer):
+                entry["prunable"] = "gitdir file points to non-existent location"
+        linked.append(entry)
+    
+    # git lists the main worktree first and the linked ones sorted by path
+    linked.sort(key=lambda wt: wt["path"])
+    return worktrees + linked
+
+def read_git_metadata(path=None, remote=True, worktrees=True, worktree_details=False):
+    """
+    Read repository information straight from .git files, without running git.
+    
+    Resolves the git directory (following .git and commondir pointers),
+    HEAD, loose and packed refs, the origin URL from config and the
+    worktrees directory. Layouts this reader does not model (bare
+    repositories, reftable, unknown extensions, includeIf, core.worktree,
+    discovery environment variables, foreign ownership) return None so the
+    caller can fall back to the git CLI.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+        remote (bool): Whether to resolve the origin URL
+        worktrees (bool): Whether to read the worktree list
+        worktree_details (bool): Whether worktrees carry locked/prunable state
+    
+    Returns:
+        dict: probe_git_repo keys plus remote_url and worktrees (the latter
+              two are only present when requested), or None if the git CLI
+              must be used instead
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    if not is_fast_path_enabled() or any(var in os.environ for var in _FAST_PATH_UNSAFE_ENV):
+        return None
+    
+    location = _discover_git_dir(path)
+    if location is None:
+        return None
+    
+    metadata = {
+        "is_repo": False,
+        "git_dir": None,
+        "common_dir": None,
+        "is_bare": False,
+        "inside_work_tree": False,
+        "root_path": None,
+        "commit_hash": None,
+        "current_branch": None
+    }
+    if not location:
+        return metadata
+    
+    git_dir = location["git_dir"]
+    common_dir = location["common_dir"]
+    
+    # Reject repository layouts the reader does not understand
+    if os.path.exists(os.path.join(common_dir, "reftable")):
+        return None
+    if os.path.exists(os.path.join(common_dir, "remotes", "origin")) or os.path.exists(os.path.join(common_dir, "branches", "origin")):
+        # Legacy remote definitions
+        return None
+    config = parse_git_config(os.path.join(common_dir, "config"))
+    if config is None:
+        return None
+    null_oid = "0" * 40
+    for section, subsection, key, value in config:
+        if section == "extensions" and key == "objectformat" and value.lower() == "sha256":
+            null_oid = "0" * 64
+        if section == "extensions" and key not in _FAST_PATH_SAFE_EXTENSIONS:
+            if key != "refstorage" or value.lower() != "files":
+                return None
+        if section == "core" and (key == "worktree" or (key == "bare" and value.lower() in ("true", "yes", "on", "1"))):
+            return None
+    
+    packed_refs = _read_packed_refs(common_dir)
+    head_ref, commit_hash = _resolve_head(git_dir, common_dir, packed_refs)
+    
+    metadata.update({
+        "is_repo": True,
+        "git_dir": git_dir,
+        "common_dir": common_dir,
+        "inside_work_tree": True,
+        "root_path": location["root_path"],
+        "commit_hash": commit_hash,
+        "current_branch": head_ref[len("refs/heads/"):] if head_ref and head_ref.startswith("refs/heads/") else ""
+    })
+    
+    if remote:
+        config_files = [parse_git_config(p) for p in _get_global_config_paths()]
+        config_files.append(config)
+        if os.path.isfile(os.path.join(git_dir, "config.worktree")):
+            config_files.append(parse_git_config(os.path.join(git_dir, "config.worktree")))
+        if any(entries is None for entries in config_files):
+            return None
+        
+        remote_url = None
+        remote_defined = False
+        rewrites = {}
+        for entries in config_files:
+            for section, subsection, key, value in entries:
+                if section == "remote" and subsection == "origin":
+                    remote_defined = True
+                    if key == "url" and remote_url is None:
+                        remote_url = value
+                elif section == "url" and key == "insteadof" and subsection is not None:
+                    rewrites[value] = subsection
+        if remote_defined and remote_url is None:
+            return None
+        
+        if remote_url and rewrites:
+            # The longest matching insteadOf prefix wins
+            matches = [prefix for prefix in rewrites if remote_url.startswith(prefix)]
+            if matches:
+                prefix = max(matches, key=len)
+                remote_url = rewrites[prefix] + remote_url[len(prefix):]
+        metadata["remote_url"] = remote_url
+    
+    if worktrees:
+        metadata["worktrees"] = _read_worktrees(common_dir, packed_refs, null_oid, worktree_details)
+        if metadata["worktrees"] is None:
+            return None
+    
+    return metadata
+
+def is_git_repo(path=None):
+    """
+    Check if the given path (or current directory) is inside a git repository.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    
+    Returns:
+        bool: True if inside a git repository
+    """
+    return _run_sync(async_is_git_repo(path))
+
+async def async_is_git_repo(path=None, timeout=None):
+    """
+    Check if the given path (or current directory) is inside a git repository.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+        timeout (float, optional): Per-command timeout in seconds
+    
+    Returns:
+        bool: True if inside a git repository
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    metadata = read_git_metadata(path, remote=False, worktrees=False)
+    if metadata is not None:
+        return metadata["is_repo"]
+    
+    return (await async_probe_git_repo(path, timeout))["is_repo"]
+
+def is_git_worktree(path=None):
+    """
+    Check if the given path (or current directory) is a git worktree.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    
+    Returns:
+        bool: True if this is a git worktree (not the main repository)
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    metadata = read_git_metadata(path, remote=False)
+    if metadata is not None:
+        return _needs_worktree_list(path, metadata) and _is_worktree(path, metadata["worktrees"])
+    
+    probe = probe_git_repo(path)
+    if not _needs_worktree_list(path, probe):
+        return False
+    
+    return _is_worktree(path, list_worktrees(path))
+
+def get_git_repo_info(path=None):
+    """
+    Get comprehensive information about the git repository.
+    
+    Synchronous wrapper around async_get_git_repo_info.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    
+    Returns:
+        dict: Repository information including:
+            - is_repo: bool
+            - is_worktree: bool
+            - root_path: str (repository root)
+            - current_branch: str
+            - remote_url: str
+            - commit_hash: str
+            - worktree_info: dict (if applicable)
+    """
+    return _run_sync(async_get_git_repo_info(path))
+
+async def async_get_git_repo_info(path=None, timeout=None):
+    """
+    Get comprehensive information about the git repository.
+    
+    Reads .git files directly when possible (see read_git_metadata).
+    Otherwise it uses one batched rev-parse, one remote lookup and at most
+    one worktree listing, started concurrently when path is a repository
+    root (see get_git_command_count for measuring this).
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+        timeout (float, optional): Per-command timeout in seconds
+    
+    Returns:
+        dict: Repository information (see get_git_repo_info)
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    metadata = read_git_metadata(path)
+    if metadata is not None:
+        return _build_repo_info(path, metadata, metadata.get("remote_url"), metadata.get("worktrees"))
+    
+    remote_args = ["remote", "get-url", "origin"]
+    if os.path.exists(os.path.join(path, ".git")):
+        # A repository root needs all three queries; run them together
+        probe, remote_result, worktrees = await asyncio.gather(
+            async_probe_git_repo(path, timeout),
+            async_run_git_command(remote_args, cwd=path, timeout=timeout),
+            async_list_worktrees(path, timeout=timeout)
+        )
+    else:
+        probe = await async_probe_git_repo(path, timeout)
+        if not probe["is_repo"]:
+            return _build_repo_info(path, probe, None, None)
+        
+        if _needs_worktree_list(path, probe):
+            remote_result, worktrees = await asyncio.gather(
+                async_run_git_command(remote_args, cwd=path, timeout=timeout),
+                async_list_worktrees(path, timeout=timeout)
+            )
+        else:
+            remote_result = await async_run_git_command(remote_args, cwd=path, timeout=timeout)
+            worktrees = None
+    
+    remote_url = None
+    if remote_result and remote_result.returncode == 0:
+        remote_url = remote_result.stdout.strip()
+    
+    return _build_repo_info(path, probe, remote_url, worktrees)
+
+def _build_repo_info(path, probe, remote_url, worktrees):
+    """
+    Assemble the get_git_repo_info dict from its already collected parts.
+    
+    Args:
+        path (str): Path being checked
+        probe (dict): Result of probe_git_repo or read_git_metadata
+        remote_url (str): Origin URL, or None
+        worktrees (list): Parsed worktree list (ignored for subdirectories)
+    
+    Returns:
+        dict: Repository information (see get_git_repo_info)
+    """
+    info = {
+        "is_repo": False,
+        "is_worktree": False,
+        "root_path": None,
+        "current_branch": None,
+        "remote_url": None,
+        "commit_hash": None,
+        "worktree_info": None
+    }
+    
+    if not probe["is_repo"]:
+        return info
+    
+    info["is_repo"] = True
+    info["root_path"] = probe["root_path"]
+    info["current_branch"] = probe["current_branch"]
+    info["remote_url"] = remote_url
+    info["commit_hash"] = probe["commit_hash"]
+    
+    # Get worktree information if applicable
+    if _needs_worktree_list(path, probe):
+        registry = WorktreeRegistry(worktrees)
+        info["is_worktree"] = _is_worktree(path, registry)
+        if info["is_worktree"]:
+            info["worktree_info"] = build_worktree_info(registry, path)
+    
+    return info
+
+def get_worktree_info(path=None):
+    """
+    Get detailed information about git worktrees.
+    
+    Synchronous wrapper around async_get_worktree_info.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    
+    Returns:
+        dict: Worktree information including:
+            - main_worktree: str (path to main worktree)
+            - all_worktrees: list (all worktrees)
+            - current_worktree: dict (current worktree info)
+    """
+    return _run_sync(async_get_worktree_info(path))
+
+async def async_get_worktree_info(path=None, timeout=None):
+    """
+    Get detailed information about git worktrees.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+        timeout (float, optional): Command timeout in seconds
+    
+    Returns:
+        dict: Worktree information (see get_worktree_info)
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    metadata = read_git_metadata(path, remote=False)
+    if metadata is not None:
+        return build_worktree_info(metadata.get("worktrees"), path)
+    
+    return build_worktree_info(await async_list_worktrees(path, timeout=timeout), path)
+
+def get_git_status_env_vars(path=None):
+    """
+    Get git repository information formatted as environment variables.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    
+    Returns:
+        dict: Environment variables for git status
+    """
+    return _env_vars_from_repo_info(get_git_repo_info(path))
+
+def _env_vars_from_repo_info(info):
+    """
+    Format a get_git_repo_info result as environment variables.
+    
+    Args:
+        info (dict): Result of get_git_repo_info
+    
+    Returns:
+        dict: Environment variables for git status
+    """
+    env_vars = {
+        "CLAUDE_GIT_IS_REPO": "true" if info["is_repo"] else "false",
+        "CLAUDE_GIT_IS_WORKTREE": "true" if info["is_worktree"] else "false",
+        "CLAUDE_GIT_ROOT_PATH": info["root_path"] or "",
+        "CLAUDE_GIT_CURRENT_BRANCH": info["current_branch"] or "",
+        "CLAUDE_GIT_REMOTE_URL": info["remote_url"] or "",
+        "CLAUDE_GIT_COMMIT_HASH": info["commit_hash"] or ""
+    }
+    
+    # Add worktree-specific environment variables
+    if info["is_worktree"] and info["worktree_info"]:
+        wt_info = info["worktree_info"]
+        env_vars.update({
+            "CLAUDE_GIT_MAIN_WORKTREE": wt_info["main_worktree"] or "",
+            "CLAUDE_GIT_WORKTREE_COUNT": str(len(wt_info["all_worktrees"])),
+            "CLAUDE_GIT_CURRENT_WORKTREE_BRANCH": wt_info["current_worktree"].get("branch", "") if wt_info["current_worktree"] else ""
+        })
+    
+    return env_vars
+
+# Persistent git info cache (see get_cached_git_repo_info)
+_GIT_INFO_CACHE_VERSION = 1
+_git_info_cache_stats = {"hits": 0, "misses": 0, "uncacheable": 0}
+_git_info_memory_cache = {}
+
+def get_claude_docker_dir():
+    """
+    Get the claude-docker state directory.
+    
+    Defaults to ~/.claude-docker and can be moved with CLAUDE_DOCKER_HOME.
+    
+    Returns:
+        Path: State directory (not created)
+    """
+    return Path(os.path.expanduser(os.environ.get("CLAUDE_DOCKER_HOME", "~/.claude-docker")))
+
+def _stat_signature(file_path):
+    """
+    Get a cheap change signature for a file.
+    
+    Args:
+        file_path (str): File to stat
+    
+    Returns:
+        list: [mtime_ns, size, inode], or None if the file does not exist
+    """
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size, st.st_ino]
+
+def _head_ref_file(git_dir, common_dir):
+    """
+    Get the loose ref file a HEAD file currently points at.
+    
+    Args:
+        git_dir (str): Git directory holding the HEAD file
+        common_dir (str): Shared git directory
+    
+    Returns:
+        str: Loose ref path, or None if HEAD is detached or unreadable
+    """
+    content = _read_text(os.path.join(git_dir, "HEAD"))
+    if not content or not content.startswith("ref:"):
+        return None
+    return _ref_file_path(git_dir, common_dir, content[len("ref:"):].strip())
+
+def _collect_cache_stamp_paths(path, location):
+    """
+    List every file whose change can alter get_git_repo_info for path.
+    
+    Args:
+        path (str): Path being looked up
+        location (dict): Result of _discover_git_dir
+    
+    Returns:
+        list: File paths to stat when validating a cache entry
+    """
+    git_dir = location["git_dir"]
+    common_dir = location["common_dir"]
+    
+    stamp_paths = [
+        os.path.join(path, ".git"),
+        os.path.join(location["root_path"], ".git"),
+        os.path.join(git_dir, "HEAD"),
+        os.path.join(git_dir, "config.worktree"),
+        os.path.join(common_dir, "packed-refs"),
+        os.path.join(common_dir, "config"),
+        os.path.join(common_dir, "worktrees"),
+    ] + _get_global_config_paths()
+    
+    # HEAD and branch of every worktree show up in all_worktrees
+    head_dirs = [git_dir, common_dir]
+    try:
+        head_dirs += [os.path.join(common_dir, "worktrees", wt_id) for wt_id in os.listdir(os.path.join(common_dir, "worktrees"))]
+    except OSError:
+        pass
+    
+    for head_dir in head_dirs:
+        stamp_paths.append(os.path.join(head_dir, "HEAD"))
+        ref_file = _head_ref_file(head_dir, common_dir)
+        if ref_file:
+            stamp_paths.append(ref_file)
+    
+    # Keep order stable and drop duplicates
+    return list(dict.fromkeys(stamp_paths))
+
+def _git_info_cache_file(resolved_path):
+    """
+    Get the cache file for a repository path.
+    
+    Args:
+        resolved_path (str): Resolved path being looked up
+    
+    Returns:
+        Path: Cache file under ~/.claude-docker/cache/git-info/
+    """
+    key = hashlib.sha1(resolved_path.encode("utf-8")).hexdigest()
+    return get_claude_docker_dir() / "cache" / "git-info" / f"{key}.json"
+
+def _is_cache_entry_valid(entry, resolved_path):
+    """
+    Validate a cache entry by re-statting the files it was stamped with.
+    
+    Args:
+        entry (dict): Cache entry
+        resolved_path (str): Path the entry should belong to
+    
+    Returns:
+        bool: True if nothing relevant changed since the entry was written
+    """
+    if not isinstance(entry, dict):
+        return False
+    if entry.get("version") != _GIT_INFO_CACHE_VERSION or entry.get("path") != resolved_path:
+        return False
+    if entry.get("fast_path") != is_fast_path_enabled():
+        return False
+    
+    stamp = entry.get("stamp")
+    if not isinstance(stamp, dict):
+        return False
+    return all(_stat_signature(file_path) == signature for file_path, signature in stamp.items())
+
+def _load_cached_git_info(path):
+    """
+    Look up path in the in-memory and on-disk caches, refreshing on a miss.
+    
+    Args:
+        path (str): Path to check
+    
+    Returns:
+        dict: Cache entry with repo_info and env_vars
+    """
+    resolved_path = os.path.realpath(path)
+    
+    entry = _git_info_memory_cache.get(resolved_path)
+    if entry is not None and _is_cache_entry_valid(entry, resolved_path):
+        _git_info_cache_stats["hits"] += 1
+        return entry
+    
+    cache_file = _git_info_cache_file(resolved_path)
+    try:
+        with open(cache_file, "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        entry = None
+    if entry is not None and _is_cache_entry_valid(entry, resolved_path):
+        _git_info_cache_stats["hits"] += 1
+        _git_info_memory_cache[resolved_path] = entry
+        return entry
+    
+    # Stamp before computing so that a change made during the lookup
+    # invalidates the entry instead of being hidden by it
+    location = _discover_git_dir(path) if not any(var in os.environ for var in _FAST_PATH_UNSAFE_ENV) else None
+    stamp = None
+    if location:
+        stamp = {file_path: _stat_signature(file_path) for file_path in _collect_cache_stamp_paths(path, location)}
+    
+    repo_info = get_git_repo_info(path)
+    entry = {
+        "version": _GIT_INFO_CACHE_VERSION,
+        "path": resolved_path,
+        "fast_path": is_fast_path_enabled(),
+        "stamp": stamp,
+        "repo_info": repo_info,
+        "env_vars": _env_vars_from_repo_info(repo_info)
+    }
+    
+    if stamp is None:
+        # Not a repository, or a layout that cannot be validated by stat
+        _git_info_cache_stats["uncacheable"] += 1
+        return entry
+    
+    _git_info_cache_stats["misses"] += 1
+    _git_info_memory_cache[resolved_path] = entry
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+    
+    return entry
+
+def get_cached_git_repo_info(path=None):
+    """
+    Get get_git_repo_info results through the persistent cache.
+    
+    Entries live under ~/.claude-docker/cache/git-info/ and are reused while
+    the HEAD files, current ref files, packed-refs, config files and
+    worktrees directory keep the same stat signature.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    
+    Returns:
+        dict: Repository information (see get_git_repo_info)
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    return _load_cached_git_info(path)["repo_info"]
+
+def get_cached_git_status_env_vars(path=None):
+    """
+    Get get_git_status_env_vars results through the persistent cache.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    
+    Returns:
+        dict: Environment variables for git status
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    return _load_cached_git_info(path)["env_vars"]
+
+def get_git_info_cache_stats():
+    """
+    Get hit/miss counters for the git info cache in this process.
+    
+    Returns:
+        dict: hits, misses and uncacheable lookups
+    """
+    return dict(_git_info_cache_stats)
+
+def export_git_env_vars(path=None):
+    """
+    Export git repository information as environment variables.
+    Prints export statements that can be sourced by shell.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    """
+    env_vars = get_git_status_env_vars(path)
+    
+    for key, value in env_vars.items():
+        print(f'export {key}="{value}"')
+
+def resolve_commit(ref, path=None):
+    """
+    Resolve a ref to a full commit hash.
+
+    Args:
+        ref (str): Branch, tag, hash or other revision expression
+        path (str, optional): Path inside the repository. Defaults to current directory.
+
+    Returns:
+        str or None: Commit hash, or None if ref does not name a commit
+    """
+    result = run_git_command(["rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"], cwd=path)
+    if result is None or result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+def get_changed_files(path=None, base_ref="HEAD"):
+    """
+    List files that differ between base_ref and the working tree.
+
+    Covers commits since base_ref, staged and unstaged edits, deletions and
+    untracked (non-ignored) files. Renames are reported as a deletion plus an
+    addition so both sides can be mapped.
+
+    Args:
+        path (str, optional): Path inside the repository. Defaults to current directory.
+        base_ref (str): Revision to compare against
+
+    Returns:
+        list or None: Sorted paths relative to the repository root, or None
+                      if base_ref cannot be resolved or git failed
+    """
+    cwd = path or os.getcwd()
+    commit = resolve_commit(base_ref, cwd)
+    if commit is None:
+        return None
+
+    # -z output keeps unusual file names intact; --relative is not used so
+    # paths stay anchored at the repository root regardless of cwd
+    diff = run_git_command(["diff", "--name-only", "--no-renames", "-z", commit, "--"], cwd=cwd)
+    untracked = run_git_command(["ls-files", "--others", "--exclude-standard", "--full-name", "-z", "--", ":/"], cwd=cwd)
+    if diff is None or diff.returncode != 0 or untracked is None or untracked.returncode != 0:
+        return None
+
+    files = set(diff.stdout.split("\0")) | set(untracked.stdout.split("\0"))
+    files.discard("")
+    return sorted(files)
+
+def get_worktree_fingerprint(path=None, exclude=None):
+    """
+    Fingerprint the full working tree state: HEAD plus every uncommitted change.
+    
+    Staged, unstaged and untracked (non-ignored) files are identified by
+    their content hash, so touching a file without changing it keeps the
+    fingerprint. Costs three git processes regardless of repository size.
+    
+    Args:
+        path (str, optional): Path inside the repository. Defaults to current directory.
+        exclude (callable, optional): Predicate on repo-relative paths to leave out
+    
+    Returns:
+        str or None: Hex digest, or None if path is not in a repository
+    """
+    probe = probe_git_repo(path)
+    if not probe["is_repo"] or not probe["root_path"]:
+        return None
+    root = probe["root_path"]
+    
+    status = run_git_command(["status", "--porcelain=v1", "-z", "--untracked-files=all",
+                              "--no-renames", "--", ":/"], cwd=root)
+    if status is None or status.returncode != 0:
+        return None
+    paths = sorted({entry[3:] for entry in status.stdout.split("\0") if len(entry) > 3})
+    if exclude:
+        paths = [p for p in paths if not exclude(p)]
+    
+    # Regular files are hashed by git in one batch; the rest are described inline
+    states = {}
+    regular = []
+    for rel_path in paths:
+        full_path = os.path.join(root, rel_path)
+        if os.path.islink(full_path):
+            states[rel_path] = "link:" + os.readlink(full_path)
+        elif os.path.isfile(full_path) and "\n" not in rel_path:
+            regular.append(rel_path)
+        else:
+            states[rel_path] = "missing" if not os.path.lexists(full_path) else "other"
+    if regular:
+        hashed = run_git_command(["hash-object", "--stdin-paths"], cwd=root, input="\n".join(regular) + "\n")
+        if hashed is None or hashed.returncode != 0:
+            return None
+        states.update(zip(regular, hashed.stdout.split()))
+    
+    digest = hashlib.sha256((probe["commit_hash"] or "unborn").encode())
+    for rel_path in paths:
+        digest.update(f"\0{rel_path}\0{states[rel_path]}".encode())
+    return digest.hexdigest()
+
+def list_worktree_files(path=None):
+    """
+    List tracked and untracked (non-ignored) files below a directory.
+
+    Args:
+        path (str, optional): Directory inside the repository. Defaults to current directory.
+
+    Returns:
+        list or None: Paths relative to path, or None if path is not in a
+                      repository or git failed
+    """
+    cwd = path or os.getcwd()
+    result = run_git_command(["ls-files", "--cached", "--others", "--exclude-standard", "-z"], cwd=cwd)
+    if result is None or result.returncode != 0:
+        return None
+    return sorted({p for p in result.stdout.split("\0") if p})
+
+def get_ignored_paths(paths, path=None):
+    """
+    Find which paths are excluded by .gitignore and friends.
+
+    One `git check-ignore --stdin` call covers every path. Tracked files
+    are never reported, matching how git itself treats them.
+
+    Args:
+        paths (list): Paths relative to path
+        path (str, optional): Directory inside the repository. Defaults to current directory.
+
+    Returns:
+        set: The ignored subset of paths (empty outside a repository)
+    """
+    if not paths:
+        return set()
+    cwd = path or os.getcwd()
+    result = run_git_command(["check-ignore", "--stdin", "-z"], cwd=cwd, input="\0".join(paths) + "\0")
+    # Exit status 1 means nothing is ignored, 128 means not a repository
+    if result is None or result.returncode != 0:
+        return set()
+    return {p for p in result.stdout.split("\0") if p}
+
+# Directories never descended into by scan_git_repos
+_SCAN_PRUNE_DIRS = {
+    ".git", "node_modules", "build", "dist", "target", ".build",
+    "DerivedData", "Pods", "__pycache__", ".venv", "venv", ".tox",
+    ".gradle", ".next", ".cache",
+}
+
+def iter_git_repo_roots(root, max_depth=None):
+    """
+    Walk a directory tree and yield every repository or worktree root.
+    
+    Uses os.scandir, does not follow symlinks and skips .git, dependency
+    and build output directories. Nested repositories are found as well.
+    
+    Args:
+        root (str): Directory to walk
+        max_depth (int, optional): Maximum depth below root to descend
+    
+    Yields:
+        str: Absolute path of each directory containing a .git entry
+    """
+    stack = [(os.path.abspath(root), 0)]
+    while stack:
+        directory, depth = stack.pop()
+        subdirs = []
+        has_git = False
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name == ".git":
+                        has_git = True
+                    elif entry.name not in _SCAN_PRUNE_DIRS:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                        except OSError:
+                            pass
+        except OSError:
+            continue
+        
+        if has_git:
+            yield directory
+        if max_depth is None or depth < max_depth:
+            stack.extend((subdir, depth + 1) for subdir in sorted(subdirs, reverse=True))
+
+def scan_git_repos(root, max_workers=8, max_depth=None):
+    """
+    Find all repositories under root and probe them concurrently.
+    
+    Probing starts as soon as each repository is found, in a bounded thread
+    pool; results are yielded in completion order.
+    
+    Args:
+        root (str): Directory to walk
+        max_workers (int): Maximum concurrent probes
+        max_depth (int, optional): Maximum depth below root to descend
+    
+    Yields:
+        dict: {"path": str} plus the get_git_repo_info keys, or an "error"
+              key if probing failed
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    
+    pending = {}
+    
+    def collect(future):
+        result = {"path": pending.pop(future)}
+        try:
+            result.update(future.result())
+        except Exception as e:
+            result["error"] = str(e)
+        return result
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for repo_path in iter_git_repo_roots(root, max_depth):
+            pending[executor.submit(get_git_repo_info, repo_path)] = repo_path
+            # Hand out finished probes while the walk goes on
+            done, _ = wait(pending, timeout=0)
+            for future in done:
+                yield collect(future)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield collect(future)
+
+def get_reference_store_path():
+    """
+    Get the shared reference object store.
+    
+    Returns:
+        Path: Bare repository under ~/.claude-docker/git-reference/
+    """
+    return get_claude_docker_dir() / "git-reference" / "objects.git"
+
+def init_reference_store():
+    """
+    Create the reference object store if it does not exist yet.
+    
+    Returns:
+        Path: Store path, or None if it could not be created
+    """
+    store = get_reference_store_path()
+    if (store / "HEAD").exists():
+        return store
+    
+    store.parent.mkdir(parents=True, exist_ok=True)
+    result = run_git_command(["init", "--bare", "--quiet", str(store)], cwd=str(store.parent))
+    if result is None or result.returncode != 0:
+        return None
+    # Registered refs keep objects alive; never let gc touch them implicitly
+    run_git_command(["config", "gc.auto", "0"], cwd=str(store))
+    return store
+
+def _get_object_store_size(repo_path):
+    """
+    Get the on-disk size of a repository's own objects (not its alternates).
+    
+    Args:
+        repo_path (str): Repository or git directory
+    
+    Returns:
+        int: Bytes in packs and loose objects
+    """
+    result = run_git_command(["count-objects", "-v"], cwd=str(repo_path))
+    if result is None or result.returncode != 0:
+        return 0
+    counts = dict(line.split(": ", 1) for line in result.stdout.splitlines() if ": " in line)
+    return (int(counts.get("size-pack", 0)) + int(counts.get("size", 0))) * 1024
+
+def _get_reference_key(path):
+    """
+    Content-address a repository by its root commit.
+    
+    Clones of the same project share the key wherever they live.
+    
+    Args:
+        path (str): Repository path
+    
+    Returns:
+        str: Root commit id, or None for a repository without commits
+    """
+    result = run_git_command(["rev-list", "--max-parents=0", "--all"], cwd=path)
+    if result is None or result.returncode != 0 or not result.stdout.split():
+        return None
+    return sorted(result.stdout.split())[0]
+
+def _load_reference_registry():
+    """
+    Load the list of repositories registered in the reference store.
+    
+    Returns:
+        dict: Root commit -> {"sources": [...], "updated": timestamp}
+    """
+    try:
+        with open(get_reference_store_path().parent / "registry.json", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_reference_registry(registry):
+    """
+    Atomically write the reference store registry.
+    
+    Args:
+        registry (dict): Result of _load_reference_registry, updated
+    """
+    registry_file = get_reference_store_path().parent / "registry.json"
+    tmp_file = registry_file.with_name(f"registry.json.{os.getpid()}.tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_file, registry_file)
+
+def register_reference_repo(path=None):
+    """
+    Copy a repository's objects into the shared reference store.
+    
+    All refs are fetched under refs/reference/<root-commit>/<source>/ so the
+    objects stay reachable in the store even if the source is deleted.
+    Registering again only transfers new objects.
+    
+    Args:
+        path (str, optional): Repository to register. Defaults to current directory.
+    
+    Returns:
+        dict: key, source, bytes_added and seconds, or None if path is not
+              a repository with commits
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    source = os.path.realpath(path)
+    key = _get_reference_key(source)
+    store = init_reference_store()
+    if key is None or store is None:
+        return None
+    
+    source_id = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+    size_before = _get_object_store_size(store)
+    start_time = time.perf_counter()
+    result = run_git_command([
+        "fetch", "--quiet", "--no-tags", "--no-write-fetch-head", source,
+        f"+refs/*:refs/reference/{key}/{source_id}/*"
+    ], cwd=str(store))
+    if result is None or result.returncode != 0:
+        return None
+    elapsed = time.perf_counter() - start_time
+    
+    registry = _load_reference_registry()
+    entry = registry.setdefault(key, {"sources": []})
+    if source not in entry["sources"]:
+        entry["sources"].append(source)
+    entry["updated"] = time.time()
+    _save_reference_registry(registry)
+    
+    return {
+        "key": key,
+        "source": source,
+        "bytes_added": _get_object_store_size(store) - size_before,
+        "seconds": round(elapsed, 3)
+    }
+
+def list_reference_repos():
+    """
+    List repositories registered in the reference store.
+    
+    Returns:
+        dict: Root commit -> {"sources": [...], "updated": timestamp}
+    """
+    return _load_reference_registry()
+
+def attach_reference_store(path=None):
+    """
+    Add the reference store to an existing repository's alternates.
+    
+    Later fetches into the repository skip objects the store already has.
+    Repositories under /workspace or /main-repo are refused: the host sees
+    them too, and for the host the alternate would dangle and the objects
+    fetched through it would be missing.
+    
+    Args:
+        path (str, optional): Repository path. Defaults to current directory.
+    
+    Returns:
+        bool: True if the store is (now) listed in the repository's alternates
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    probe = probe_git_repo(path)
+    if not probe["is_repo"]:
+        return False
+    if _is_host_visible_path(path) or _is_host_visible_path(probe["common_dir"]):
+        print(f"Not attaching the reference store to {probe['common_dir']}: the host shares this repository "
+              f"and cannot see the store", file=sys.stderr)
+        return False
+    store = init_reference_store()
+    if store is None:
+        return False
+    
+    store_objects = str(store / "objects")
+    alternates_file = Path(probe["common_dir"]) / "objects" / "info" / "alternates"
+    existing = alternates_file.read_text().splitlines() if alternates_file.exists() else []
+    if store_objects not in existing:
+        alternates_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(alternates_file, "a") as f:
+            f.write(store_objects + "\n")
+    return True
+
+def _is_host_visible_path(path):
+    """
+    Check whether a path lives on a bind mount shared with the host, where
+    alternates pointing into the container's home would dangle.
+    
+    Args:
+        path (str): Path to check
+    
+    Returns:
+        bool: True for paths under /workspace or /main-repo
+    """
+    resolved = os.path.realpath(path)
+    for mount in ("/workspace", os.environ.get("MAIN_REPO_PATH", "/main-repo")):
+        if resolved == mount or resolved.startswith(mount + os.sep):
+            return True
+    return False
+
+def reference_clone(url, dest, dissociate=None, measure_baseline=False, extra_args=None):
+    """
+    Clone using the reference store so known objects are not transferred.
+    
+    Local sources are registered first. The clone borrows objects through
+    alternates; with dissociate (the default for destinations under
+    /workspace or /main-repo, which the host also sees) the borrowed
+    objects are copied in afterwards so the clone stands alone.
+    
+    Args:
+        url (str): Repository URL or path (use file:// to force a pack
+                   transfer for local sources)
+        dest (str): Destination directory
+        dissociate (bool, optional): Copy borrowed objects into the clone
+        measure_baseline (bool): Also clone without the store into a
+                                 temporary directory to measure the savings
+        extra_args (list, optional): Additional `git clone` arguments
+    
+    Returns:
+        dict: returncode, seconds, bytes_transferred, bytes_reused,
+              dissociated and (with measure_baseline) baseline_seconds,
+              baseline_bytes, bytes_saved and seconds_saved
+    """
+    store = init_reference_store()
+    
+    local_source = url[len("file://"):] if url.startswith("file://") else url
+    if os.path.isdir(local_source):
+        register_reference_repo(local_source)
+    
+    if dissociate is None:
+        dissociate = _is_host_visible_path(os.path.dirname(os.path.abspath(dest)) or ".")
+    
+    clone_args = ["clone", "--quiet"]
+    if store is not None:
+        clone_args += ["--reference-if-able", str(store)]
+    clone_args += (extra_args or []) + [url, dest]
+    
+    start_time = time.perf_counter()
+    result = run_git_command(clone_args, cwd=os.getcwd())
+    elapsed = time.perf_counter() - start_time
+    
+    report = {
+        "returncode": result.returncode if result else None,
+        "seconds": round(elapsed, 3),
+        "dissociated": False
+    }
+    if result is None or result.returncode != 0:
+        report["error"] = result.stderr.strip() if result else "git not found"
+        return report
+    
+    report["bytes_transferred"] = _get_object_store_size(dest)
+    usage_result = run_git_command(["rev-list", "--objects", "--all", "--disk-usage"], cwd=dest)
+    if usage_result and usage_result.returncode == 0:
+        report["bytes_reused"] = max(int(usage_result.stdout.strip()) - report["bytes_transferred"], 0)
+    
+    if dissociate and store is not None:
+        # Same as `git clone --dissociate`: pull borrowed objects in, drop alternates
+        run_git_command(["repack", "-a", "-d", "-q"], cwd=dest)
+        alternates_file = Path(dest) / ".git" / "objects" / "info" / "alternates"
+        if alternates_file.exists():
+            alternates_file.unlink()
+        report["dissociated"] = True
+    
+    if measure_baseline:
+        import tempfile
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            baseline_dest = os.path.join(tmp_dir, "baseline")
+            start_time = time.perf_counter()
+            baseline = run_git_command(["clone", "--quiet"] + (extra_args or []) + [url, baseline_dest], cwd=tmp_dir)
+            baseline_elapsed = time.perf_counter() - start_time
+            if baseline and baseline.returncode == 0:
+                report["baseline_seconds"] = round(baseline_elapsed, 3)
+                report["baseline_bytes"] = _get_object_store_size(baseline_dest)
+                report["bytes_saved"] = report["baseline_bytes"] - report["bytes_transferred"]
+                report["seconds_saved"] = round(baseline_elapsed - elapsed, 3)
+    
+    return report
+
+def _time_git_command(args, cwd, runs=3):
+    """
+    Time a git command, taking the median of several runs.
+    
+    Args:
+        args (list): Git command arguments
+        cwd (str): Working directory
+        runs (int): Number of runs
+    
+    Returns:
+        float: Median wall time in milliseconds, or None if git failed
+    """
+    timings = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        result = run_git_command(args, cwd=cwd)
+        if result is None or result.returncode != 0:
+            return None
+        timings.append((time.perf_counter() - start_time) * 1000)
+    timings.sort()
+    return round(timings[len(timings) // 2], 1)
+
+def _read_index_entry_count(git_dir):
+    """
+    Read the number of tracked files from the index header.
+    
+    Args:
+        git_dir (str): Worktree git directory
+    
+    Returns:
+        int: Index entries, or None if the index cannot be read
+    """
+    try:
+        with open(os.path.join(git_dir, "index"), "rb") as f:
+            header = f.read(12)
+    except OSError:
+        return None
+    if len(header) < 12 or header[:4] != b"DIRC":
+        return None
+    return int.from_bytes(header[8:12], "big")
+
+def inspect_repo_performance(path=None):
+    """
+    Collect the repository facts that decide which git features to tune.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    
+    Returns:
+        dict: root_path, git_dir, common_dir, worktree_of_main_repo,
+              tracked_files, packs, pack_size_kib, loose_objects and the
+              current state of each tunable feature
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    probe = probe_git_repo(path)
+    if not probe["is_repo"] or not probe["root_path"]:
+        return None
+    
+    root_path = probe["root_path"]
+    main_repo = os.environ.get("MAIN_REPO_PATH", "/main-repo")
+    common_dir = os.path.realpath(probe["common_dir"])
+    
+    report = {
+        "root_path": root_path,
+        "git_dir": probe["git_dir"],
+        "common_dir": common_dir,
+        "worktree_of_main_repo": probe["git_dir"] != common_dir and common_dir.startswith(os.path.realpath(main_repo) + os.sep),
+        "tracked_files": _read_index_entry_count(probe["git_dir"]),
+        "packs": 0,
+        "pack_size_kib": 0,
+        "loose_objects": 0
+    }
+    
+    count_result = run_git_command(["count-objects", "-v"], cwd=root_path)
+    if count_result and count_result.returncode == 0:
+        counts = dict(line.split(": ", 1) for line in count_result.stdout.splitlines() if ": " in line)
+        report["packs"] = int(counts.get("packs", 0))
+        report["pack_size_kib"] = int(counts.get("size-pack", 0))
+        report["loose_objects"] = int(counts.get("count", 0))
+    
+    def get_config(key):
+        result = run_git_command(["config", "--get", key], cwd=root_path)
+        return result.stdout.strip() if result and result.returncode == 0 else None
+    
+    objects_info = os.path.join(common_dir, "objects", "info")
+    report["untracked_cache"] = get_config("core.untrackedCache") == "true"
+    report["commit_graph"] = os.path.exists(os.path.join(objects_info, "commit-graph")) or os.path.isdir(os.path.join(objects_info, "commit-graphs"))
+    report["multi_pack_index"] = os.path.exists(os.path.join(common_dir, "objects", "pack", "multi-pack-index"))
+    report["fsmonitor"] = get_config("core.fsmonitor")
+    
+    daemon_result = run_git_command(["fsmonitor--daemon", "status"], cwd=root_path)
+    report["fsmonitor_supported"] = bool(daemon_result) and "not supported" not in daemon_result.stderr and "is not a git command" not in daemon_result.stderr
+    
+    return report
+
+def _pick_log_path(root_path):
+    """
+    Pick a file for timing `git log -- <path>`: the most recently changed one.
+    
+    Looks at the last 50 commits so empty or merge commits are skipped.
+    
+    Args:
+        root_path (str): Repository root
+    
+    Returns:
+        str: Path relative to the root, or None for an empty history
+    """
+    result = run_git_command(["log", "-50", "--format=", "--name-only"], cwd=root_path)
+    if result is None or result.returncode != 0:
+        return None
+    names = result.stdout.split()
+    return names[0] if names else None
+
+def tune_git_repo(path=None, dry_run=False, log_path=None, runs=3):
+    """
+    Enable and refresh git performance features for a large repository.
+    
+    Turns on the untracked cache, (re)writes a split commit-graph with
+    changed-path Bloom filters, writes a multi-pack-index when there are
+    several packs and starts the builtin fsmonitor daemon where git supports
+    it. Repository-wide settings land in the shared config, so a worktree of
+    /main-repo tunes the main repository too. Timings of `git status` and
+    `git log -- <path>` are taken before and after.
+    
+    Args:
+        path (str, optional): Path to tune. Defaults to current directory.
+        dry_run (bool): Only inspect and time, change nothing
+        log_path (str, optional): File used for the `git log` timing
+        runs (int): Timing runs per command (the median is reported)
+    
+    Returns:
+        dict: Inspection report with "actions" and "timings", or None if
+              path is not inside a work tree
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    report = inspect_repo_performance(path)
+    if report is None:
+        return None
+    
+    root_path = report["root_path"]
+    log_path = log_path or _pick_log_path(root_path)
+    status_args = ["status", "--porcelain"]
+    log_args = ["log", "--format=%H", "--", log_path] if log_path else None
+    
+    report["timings"] = {
+        "status": {"before_ms": _time_git_command(status_args, root_path, runs)},
+        "log_path": {"path": log_path, "before_ms": _time_git_command(log_args, root_path, runs) if log_args else None}
+    }
+    
+    actions = []
+    
+    def apply(feature, args_list):
+        if dry_run:
+            actions.append({"feature": feature, "status": "would-run", "commands": [" ".join(["git"] + a) for a in args_list]})
+            return
+        for args in args_list:
+            result = run_git_command(args, cwd=root_path)
+            if result is None or result.returncode != 0:
+                actions.append({"feature": feature, "status": "failed", "error": (result.stderr.strip() if result else "git not found")})
+                return
+        actions.append({"feature": feature, "status": "applied"})
+    
+    # Untracked cache is stored in each worktree's index, so always refresh it
+    apply("untracked-cache", [["config", "core.untrackedCache", "true"], ["update-index", "--untracked-cache"]])
+    
+    # An incremental split graph keeps maintenance cheap on repeat runs
+    apply("commit-graph", [["commit-graph", "write", "--reachable", "--changed-paths", "--split"]])
+    
+    if report["packs"] > 1:
+        apply("multi-pack-index", [["multi-pack-index", "write"]])
+    else:
+        actions.append({"feature": "multi-pack-index", "status": "skipped", "reason": f"{report['packs']} pack(s)"})
+    
+    if report["fsmonitor_supported"]:
+        apply("fsmonitor", [["config", "core.fsmonitor", "true"], ["fsmonitor--daemon", "start"]])
+    else:
+        actions.append({"feature": "fsmonitor", "status": "unsupported", "reason": "builtin fsmonitor daemon not available on this platform"})
+    
+    report["actions"] = actions
+    
+    if not dry_run:
+        # Prime the untracked cache and fsmonitor state before timing
+        run_git_command(status_args, cwd=root_path)
+        report["timings"]["status"]["after_ms"] = _time_git_command(status_args, root_path, runs)
+        report["timings"]["log_path"]["after_ms"] = _time_git_command(log_args, root_path, runs) if log_args else None
+    
+    return report
+
+def benchmark_git_utils(path=None, iterations=20):
+    """
+    Measure subprocess count and wall time of the public query functions.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+        iterations (int): Number of calls per function
+    
+    Returns:
+        dict: Per-function results with git_commands_per_call and ms_per_call,
+              plus git info cache counters
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    results = {}
+    for func in (is_git_repo, is_git_worktree, get_worktree_info, get_git_repo_info, get_cached_git_repo_info):
+        start_count = get_git_command_count()
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            func(path)
+        elapsed = time.perf_counter() - start_time
+        results[func.__name__] = {
+            "git_commands_per_call": (get_git_command_count() - start_count) / iterations,
+            "ms_per_call": round(elapsed * 1000 / iterations, 2)
+        }
+    results["git_info_cache"] = get_git_info_cache_stats()
+    
+    return results
+
+def verify_fast_path(path=None):
+    """
+    Compare the .git file reader against the git CLI for one path.
+    
+    Args:
+        path (str, optional): Path to check. Defaults to current directory.
+    
+    Returns:
+        dict: {"supported": bool, "match": bool, "fast": dict, "cli": dict}
+    """
+    if path is None:
+        path = os.getcwd()
+    
+    fast_info = get_git_repo_info(path)
+    fast_worktrees = get_worktree_info(path)
+    supported = read_git_metadata(path) is not None
+    
+    previous = os.environ.get("CLAUDE_GIT_FAST_PATH")
+    os.environ["CLAUDE_GIT_FAST_PATH"] = "false"
+    try:
+        cli_info = get_git_repo_info(path)
+        cli_worktrees = get_worktree_info(path)
+    finally:
+        if previous is None:
+            del os.environ["CLAUDE_GIT_FAST_PATH"]
+        else:
+            os.environ["CLAUDE_GIT_FAST_PATH"] = previous
+    
+    return {
+        "supported": supported,
+        "match": fast_info == cli_info and fast_worktrees == cli_worktrees,
+        "fast": {"repo_info": fast_info, "worktree_info": fast_worktrees},
+        "cli": {"repo_info": cli_info, "worktree_info": cli_worktrees}
+    }
+
+if __name__ == "__main__":
+    # Command line interface for testing
+    import sys
+    
+    if len(sys.argv) > 1:
+        command = sys.argv[1]
+        # Split "--flag", "--key value" / "--key=value" options from positionals
+        options = {}
+        positional = []
+        remaining = sys.argv[2:]
+        while remaining:
+            arg = remaining.pop(0)
+            if arg.startswith("--"):
+                key, _, value = arg[2:].partition("=")
+                if not value and key in ("workers", "max-depth", "log-path") and remaining:
+                    value = remaining.pop(0)
+                options[key] = value or True
+            else:
+                positional.append(arg)
+        path = positional[0] if positional else None
+        
+        if command == "info":
+            info = get_git_repo_info(path)
+            print(json.dumps(info, indent=2))
+        elif command == "json":
+            info = get_git_repo_info(path)
+            print(json.dumps(info))
+        elif command == "cached-json":
+            info = get_cached_git_repo_info(path)
             print(json.dumps(info))
         elif command == "env":
             export_git_env_vars(path)
@@ -282,9 +2342,68 @@ if __name__ == "__main__":
             print("true" if is_git_repo(path) else "false")
         elif command == "is-worktree":
             print("true" if is_git_worktree(path) else "false")
+        elif command == "worktrees":
+            registry = get_worktree_registry(path)
+            current = registry.find_by_path(path or os.getcwd())
+            worktrees = registry.list()
+            for wt in worktrees:
+                wt["is_current"] = current is not None and wt["path"] == current["path"]
+            if "json" in options:
+                print(json.dumps({
+                    "main_worktree": registry.main_worktree["path"] if registry.main_worktree else None,
+                    "current_worktree": current["path"] if current else None,
+                    "worktrees": worktrees
+                }, indent=2))
+            else:
+                for wt in worktrees:
+                    state = [flag for flag in ("is_main", "is_current", "detached", "bare", "locked", "prunable") if wt[flag]]
+                    print(f"{wt['path']}  {(wt['commit'] or '')[:12]}  {wt['branch'] or '-'}  {' '.join(state)}")
+        elif command == "scan":
+            max_depth = options.get("max-depth")
+            for result in scan_git_repos(path or os.getcwd(),
+                                         max_workers=int(options.get("workers", 8)),
+                                         max_depth=int(max_depth) if max_depth else None):
+                print(json.dumps(result), flush=True)
+        elif command == "reference":
+            action = positional[0] if positional else "list"
+            if action == "register":
+                result = register_reference_repo(positional[1] if len(positional) > 1 else None)
+                if result is None:
+                    print("Not a git repository with commits (or the store could not be updated)")
+                    sys.exit(1)
+                print(json.dumps(result, indent=2))
+            elif action == "attach":
+                attached = attach_reference_store(positional[1] if len(positional) > 1 else None)
+                print("true" if attached else "false")
+                sys.exit(0 if attached else 1)
+            elif action == "clone" and len(positional) >= 3:
+                result = reference_clone(
+                    positional[1], positional[2],
+                    dissociate=True if "dissociate" in options else None,
+                    measure_baseline="baseline" in options
+                )
+                print(json.dumps(result, indent=2))
+                sys.exit(0 if result["returncode"] == 0 else 1)
+            elif action == "list":
+                print(json.dumps(list_reference_repos(), indent=2))
+            else:
+                print("Usage: git_utils.py reference [list|register [path]|attach [path]|clone <url> <dest> [--dissociate] [--baseline]]")
+                sys.exit(1)
+        elif command == "tune":
+            report = tune_git_repo(path, dry_run="dry-run" in options, log_path=options.get("log-path"))
+            if report is None:
+                print("Not inside a git work tree")
+                sys.exit(1)
+            print(json.dumps(report, indent=2))
+        elif command == "bench":
+            print(json.dumps(benchmark_git_utils(path), indent=2))
+        elif command == "verify-fast-path":
+            result = verify_fast_path(path)
+            print(json.dumps(result, indent=2))
+            sys.exit(0 if result["match"] else 1)
         else:
             print(f"Unknown command: {command}")
-            print("Usage: git_utils.py [info|json|env|is-repo|is-worktree] [path]")
+            print("Usage: git_utils.py [info|json|cached-json|env|is-repo|is-worktree|worktrees [--json]|scan [--workers N] [--max-depth N]|tune [--dry-run] [--log-path P]|reference ...|bench|verify-fast-path] [path]")
     else:
         # Default: export environment variables
         export_git_env_vars()
\ No newline at end of file
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Summarize claude-docker launch traces.
+
+With CLAUDE_DOCKER_TRACE=1, claude-docker.sh and the container's startup.sh
+write one Chrome trace-event file per launch to ~/.claude-docker/traces/
+(open it in chrome://tracing or https://ui.perfetto.dev). This tool reads
+the most recent ones and reports which phases the launch time goes to.
+
+Usage:
+    python3 launch_trace.py summary [--last N] [--json]
+    python3 launch_trace.py list
+    python3 launch_trace.py prune [--keep N]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+
+from git_utils import get_claude_docker_dir
+
+# Phases that span the whole session rather than the launch
+_SESSION_CATEGORIES = {"session"}
+
+
+def get_trace_dir():
+    """Get the directory launch traces are written to."""
+    return get_claude_docker_dir() / "traces"
+
+
+def list_traces(last=None):
+    """
+    List trace files, newest first.
+
+    Args:
+        last (int): Only return this many
+
+    Returns:
+        list: Paths of trace files
+    """
+    trace_dir = get_trace_dir()
+    if not trace_dir.is_dir():
+        return []
+    # Names start with a sortable timestamp
+    traces = sorted(trace_dir.glob("*.json"), key=lambda p: p.name, reverse=True)
+    return traces[:last] if last else traces
+
+
+def load_trace(path):
+    """
+    Read the events of one trace file.
+
+    Accepts the JSON array format without its closing bracket (how the
+    launcher writes it, so the container can keep appending) as well as
+    complete files and the {"traceEvents": [...]} object format.
+
+    Args:
+        path (Path): Trace file
+
+    Returns:
+        list: Trace events, empty if the file cannot be parsed
+    """
+    try:
+        text = path.read_text().strip()
+    except OSError:
+        return []
+    if text.startswith("[") and not text.endswith("]"):
+        text = text.rstrip(",") + "]"
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return []
+    if isinstance(data, dict):
+        data = data.get("traceEvents", [])
+    return [event for event in data if isinstance(event, dict)]
+
+
+def summarize_launch(events):
+    """
+    Reduce one launch to its phase durations.
+
+    Args:
+        events (list): Events of one trace
+
+    Returns:
+        dict: {"phases": {name: ms}, with container phases named
+               "container/<name>", "total_ms": time from the first phase
+               to Claude being exec'd (or to the end of the last phase when
+               the container did not report), "reached_claude": bool}
+    """
+    phases = {}
+    start = end = None
+    for event in events:
+        if event.get("ph") != "X" or event.get("cat") in _SESSION_CATEGORIES:
+            continue
+        # Container phases may reuse launcher phase names (env_load)
+        name = event["name"] if event.get("cat", "launcher") == "launcher" else f"{event['cat']}/{event['name']}"
+        phases[name] = phases.get(name, 0.0) + event["dur"] / 1000
+        start = event["ts"] if start is None else min(start, event["ts"])
+        end = event["ts"] + event["dur"] if end is None else max(end, event["ts"] + event["dur"])
+
+    exec_ts = next((e["ts"] for e in events if e.get("ph") == "i" and e.get("name") == "exec_claude"), None)
+    if exec_ts is not None:
+        end = exec_ts
+    total = (end - start) / 1000 if start is not None else 0.0
+    return {"phases": phases, "total_ms": round(total, 1), "reached_claude": exec_ts is not None}
+
+
+def summarize_traces(last=10):
+    """
+    Aggregate the phases of the last launches, slowest first.
+
+    Args:
+        last (int): Number of most recent launches to include
+
+    Returns:
+        dict: {"launches": int, "total_ms": {"median", "max"},
+               "phases": [{"name", "launches", "mean_ms", "median_ms",
+               "max_ms", "share"}]} where share is the phase's part of the
+               summed launch time
+    """
+    launches = []
+    for path in list_traces(last):
+        launch = summarize_launch(load_trace(path))
+        if launch["phases"]:
+            launch["trace"] = str(path)
+            launches.append(launch)
+
+    durations = {}
+    for launch in launches:
+        for name, ms in launch["phases"].items():
+            durations.setdefault(name, []).append(ms)
+
+    totals = [launch["total_ms"] for launch in launches]
+    grand_total = sum(totals) or 1.0
+    phases = [{
+        "name": name,
+        "launches": len(values),
+        "mean_ms": round(statistics.fmean(values), 1),
+        "median_ms": round(statistics.median(values), 1),
+        "max_ms": round(max(values), 1),
+        "share": round(sum(values) / grand_total, 3)
+    } for name, values in durations.items()]
+    phases.sort(key=lambda phase: phase["mean_ms"], reverse=True)
+
+    return {
+        "launches": len(launches),
+        "total_ms": {
+            "median": round(statistics.median(totals), 1) if totals else 0.0,
+            "max": round(max(totals), 1) if totals else 0.0
+        },
+        "phases": phases
+    }
+
+
+def prune_traces(keep=50):
+    """
+    Delete all but the newest traces.
+
+    Args:
+        keep (int): Number of traces to keep
+
+    Returns:
+        int: Number of files deleted
+    """
+    removed = 0
+    for path in list_traces()[keep:]:
+        try:
+            path.unlink()
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize claude-docker launch traces (CLAUDE_DOCKER_TRACE=1)")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    summary_parser = subparsers.add_parser("summary", help="Slowest launch phases across recent launches")
+    summary_parser.add_argument("--last", type=int, default=10, help="Number of recent launches (default: 10)")
+    summary_parser.add_argument("--json", action="store_true", help="Output as JSON")
+
+    subparsers.add_parser("list", help="List recorded launches")
+
+    prune_parser = subparsers.add_parser("prune", help="Delete old traces")
+    prune_parser.add_argument("--keep", type=int, default=50, help="Number of traces to keep (default: 50)")
+
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        summary = summarize_traces(args.last)
+        if args.json:
+            print(json.dumps(summary, indent=2))
+        elif not summary["launches"]:
+            print(f"No traces in {get_trace_dir()}; launch with CLAUDE_DOCKER_TRACE=1 claude-docker")
+        else:
+            print(f"Slowest phases over the last {summary['launches']} launch(es) "
+                  f"(time to Claude: median {summary['total_ms']['median'] / 1000:.2f}s, "
+                  f"max {summary['total_ms']['max'] / 1000:.2f}s)")
+            width = max(len(phase["name"]) for phase in summary["phases"])
+            print(f"  {'phase':<{width}}  {'mean':>9}  {'median':>9}  {'max':>9}  {'share':>6}  launches")
+            for phase in summary["phases"]:
+                print(f"  {phase['name']:<{width}}  {phase['mean_ms']:>7.1f}ms  {phase['median_ms']:>7.1f}ms  "
+                      f"{phase['max_ms']:>7.1f}ms  {phase['share']:>6.0%}  {phase['launches']}")
+
+    elif args.command == "list":
+        traces = list_traces()
+        if not traces:
+            print(f"No traces in {get_trace_dir()}")
+        for path in traces:
+            launch = summarize_launch(load_trace(path))
+            slowest = max(launch["phases"].items(), key=lambda item: item[1], default=None)
+            note = "" if launch["reached_claude"] else "  (no container phases)"
+            print(f"{path.name}  {launch['total_ms'] / 1000:6.2f}s"
+                  f"{f'  slowest: {slowest[0]} {slowest[1]:.0f}ms' if slowest else ''}{note}")
+
+    elif args.command == "prune":
+        print(f"Deleted {prune_traces(args.keep)} trace(s)")
+
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+run_test(affected=True) goes through run_affected_tests to the builder's
+execute_command. The builder is replaced by a stub that rejects arguments
+the real execute_command does not take.
+"""
+
+import inspect
+import subprocess
+
+import pytest
+
+import macos_builder
+from macos_builder import MacOSBuilder, run_test
+
+
+TEST_COMMAND = "pytest -q"
+
+
+class StubBuilder:
+    """Records the commands it is asked to run; every run passes."""
+
+    calls = []
+
+    def get_host_working_directory(self):
+        return "/host/project"
+
+    def execute_command(self, command, **kwargs):
+        inspect.signature(MacOSBuilder.execute_command).bind(self, command, **kwargs)
+        self.calls.append(command)
+        return subprocess.CompletedProcess(command, 0)
+
+
+def git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """A committed Python project with a configured test command."""
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv("HOME", str(home))
+    monkeypatch.setenv("CLAUDE_DOCKER_HOME", str(home / ".claude-docker"))
+    monkeypatch.setenv("MACOS_COORDINATOR", "false")
+    for name in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{name}_NAME", "Test")
+        monkeypatch.setenv(f"GIT_{name}_EMAIL", "test@example.com")
+
+    path = tmp_path / "project"
+    path.mkdir()
+    (path / "app.py").write_text("VALUE = 1\n")
+    (path / ".gitignore").write_text(".claude/\n")
+    git("init", "-q", "-b", "main", cwd=path)
+    git("add", "-A", cwd=path)
+    git("commit", "-q", "-m", "initial", cwd=path)
+    monkeypatch.chdir(path)
+
+    monkeypatch.setattr(macos_builder, "MacOSBuilder", StubBuilder)
+    monkeypatch.setattr(macos_builder, "get_configured_build_commands", lambda *args, **kwargs: {"test": TEST_COMMAND})
+    monkeypatch.setattr(StubBuilder, "calls", [])
+    return path
+
+
+def test_affected_runs_full_suite_without_green_run(project):
+    result = run_test(affected=True, force=False)
+    assert result.returncode == 0
+    assert StubBuilder.calls == [TEST_COMMAND]
+    assert macos_builder.load_last_green(TEST_COMMAND, str(project)) is not None
+
+
+def test_affected_skips_unchanged_tree_unless_forced(project):
+    run_test(affected=True)
+    run_test(affected=True, force=False)
+    assert StubBuilder.calls == [TEST_COMMAND]
+
+    run_test(affected=True, force=True)
+    assert StubBuilder.calls == [TEST_COMMAND, TEST_COMMAND]
+
+
+def test_dirty_tree_is_not_recorded_as_green(project):
+    (project / "app.py").write_text("VALUE = 2\n")
+    run_test(affected=True)
+    assert macos_builder.load_last_green(TEST_COMMAND, str(project)) is None
+
+    git("commit", "-q", "-am", "change", cwd=project)
+    run_test(affected=True)
+    assert macos_builder.load_last_green(TEST_COMMAND, str(project)) is not None
@@ -0,0 +1,52 @@
+"""
+go test prints t.Log and t.Error output in the same path.go:line: form as
+the compiler. DiagnosticsExtractor must only report it as an error for
+tests that failed.
+"""
+
+from macos_builder import DiagnosticsExtractor
+
+
+def extract(output):
+    extractor = DiagnosticsExtractor("test")
+    for line in output.splitlines():
+        extractor(line)
+    return [(d["severity"], d["file"], d["line"]) for d in extractor.diagnostics]
+
+
+def test_go_compiler_output_is_an_error():
+    assert extract("# example.com/app\n./main.go:12:5: undefined: x\n") == [("error", "main.go", 12)]
+
+
+def test_go_test_verbose_output_follows_the_verdict():
+    output = """=== RUN   TestParse
+    parse_test.go:10: parsing input
+--- PASS: TestParse (0.00s)
+=== RUN   TestTable
+=== RUN   TestTable/ok
+    table_test.go:20: row ok
+=== RUN   TestTable/bad
+    table_test.go:25: expected 1, got 2
+--- FAIL: TestTable (0.00s)
+    --- PASS: TestTable/ok (0.00s)
+    --- FAIL: TestTable/bad (0.00s)
+=== RUN   TestLater
+    later_test.go:5: still logging
+--- PASS: TestLater (0.00s)
+FAIL
+"""
+    assert sorted(extract(output)) == [
+        ("error", "table_test.go", 25),
+        ("note", "later_test.go", 5),
+        ("note", "parse_test.go", 10),
+        ("note", "table_test.go", 20),
+    ]
+
+
+def test_go_test_output_of_failed_test_without_verbose():
+    output = """--- FAIL: TestSum (0.00s)
+    sum_test.go:8: got 3, want 4
+FAIL
+FAIL\texample.com/app\t0.01s
+"""
+    assert extract(output) == [("error", "sum_test.go", 8)]
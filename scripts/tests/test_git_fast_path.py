@@ -0,0 +1,159 @@
+"""
+The .git file reader (read_git_metadata) must give the same answers as the
+git CLI. Each test builds repositories and worktrees with git itself and
+compares get_git_repo_info and get_worktree_info with CLAUDE_GIT_FAST_PATH
+on and off.
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import git_utils
+
+
+def git(*args, cwd):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+
+
+@pytest.fixture(autouse=True)
+def isolated_git(tmp_path, monkeypatch):
+    """Keep the user's git configuration out of the comparison."""
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv("HOME", str(home))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(home / ".config"))
+    for name in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{name}_NAME", "Test")
+        monkeypatch.setenv(f"GIT_{name}_EMAIL", "test@example.com")
+    # These send the fast path to the CLI on purpose
+    for var in git_utils._FAST_PATH_UNSAFE_ENV:
+        monkeypatch.delenv(var, raising=False)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A repository with one commit, a subdirectory and an origin remote."""
+    path = tmp_path / "repo"
+    (path / "src" / "nested").mkdir(parents=True)
+    (path / "src" / "nested" / "main.rs").write_text("fn main() {}\n")
+    git("init", "-q", "-b", "main", cwd=path)
+    git("remote", "add", "origin", "https://example.com/project.git", cwd=path)
+    git("add", "-A", cwd=path)
+    git("commit", "-q", "-m", "initial", cwd=path)
+    return path
+
+
+def collect(path, monkeypatch, fast):
+    monkeypatch.setenv("CLAUDE_GIT_FAST_PATH", "true" if fast else "false")
+    return git_utils.get_git_repo_info(str(path)), git_utils.get_worktree_info(str(path))
+
+
+def assert_same_as_cli(path, monkeypatch, fast_path_used=True):
+    """Compare both paths and check the fast path actually answered."""
+    monkeypatch.setenv("CLAUDE_GIT_FAST_PATH", "true")
+    assert (git_utils.read_git_metadata(str(path)) is not None) == fast_path_used
+    fast = collect(path, monkeypatch, fast=True)
+    cli = collect(path, monkeypatch, fast=False)
+    assert fast == cli
+    return fast
+
+
+def test_main_worktree(repo, monkeypatch):
+    info, _ = assert_same_as_cli(repo, monkeypatch)
+    assert info["is_repo"] and info["current_branch"] == "main"
+    assert info["remote_url"] == "https://example.com/project.git"
+
+
+def test_subdirectory(repo, monkeypatch):
+    info, _ = assert_same_as_cli(repo / "src" / "nested", monkeypatch)
+    assert info["root_path"] == str(repo)
+
+
+def test_not_a_repository(tmp_path, monkeypatch):
+    plain = tmp_path / "plain"
+    plain.mkdir()
+    fast = collect(plain, monkeypatch, fast=True)
+    assert fast == collect(plain, monkeypatch, fast=False)
+    assert not fast[0]["is_repo"]
+
+
+def test_linked_worktree(repo, tmp_path, monkeypatch):
+    linked = tmp_path / "linked"
+    git("worktree", "add", "-q", "-b", "feature", str(linked), cwd=repo)
+    info, worktrees = assert_same_as_cli(linked, monkeypatch)
+    assert info["is_worktree"] and info["current_branch"] == "feature"
+    assert len(worktrees["all_worktrees"]) == 2
+    # The main worktree lists the linked one the same way
+    assert_same_as_cli(repo, monkeypatch)
+
+
+def test_linked_worktree_subdirectory(repo, tmp_path, monkeypatch):
+    linked = tmp_path / "linked"
+    git("worktree", "add", "-q", "-b", "feature", str(linked), cwd=repo)
+    assert_same_as_cli(linked / "src", monkeypatch)
+
+
+def test_locked_worktree(repo, tmp_path, monkeypatch):
+    locked = tmp_path / "locked"
+    git("worktree", "add", "-q", "-b", "locked", str(locked), cwd=repo)
+    git("worktree", "lock", "--reason", "on a removable disk", str(locked), cwd=repo)
+    assert_same_as_cli(locked, monkeypatch)
+    assert_same_as_cli(repo, monkeypatch)
+
+
+def test_detached_worktree(repo, tmp_path, monkeypatch):
+    detached = tmp_path / "detached"
+    git("worktree", "add", "-q", "--detach", str(detached), cwd=repo)
+    info, _ = assert_same_as_cli(detached, monkeypatch)
+    assert info["is_worktree"] and info["commit_hash"]
+
+
+def test_unborn_branch(tmp_path, monkeypatch):
+    unborn = tmp_path / "unborn"
+    unborn.mkdir()
+    git("init", "-q", "-b", "trunk", cwd=unborn)
+    info, _ = assert_same_as_cli(unborn, monkeypatch)
+    assert info["commit_hash"] is None
+
+
+def test_pruned_worktrees(repo, tmp_path, monkeypatch):
+    prunable = tmp_path / "prunable"
+    pruned = tmp_path / "pruned"
+    git("worktree", "add", "-q", "-b", "prunable", str(prunable), cwd=repo)
+    git("worktree", "add", "-q", "-b", "pruned", str(pruned), cwd=repo)
+    shutil.rmtree(prunable)
+    shutil.rmtree(pruned)
+    # One directory is gone but still registered, the other is pruned
+    git("worktree", "prune", "--expire", "now", cwd=repo)
+    prunable.mkdir()
+    git("worktree", "add", "-q", "-B", "prunable", str(prunable / "wt"), cwd=repo)
+    shutil.rmtree(prunable / "wt")
+    assert_same_as_cli(repo, monkeypatch)
+
+
+def test_packed_only_refs(repo, tmp_path, monkeypatch):
+    linked = tmp_path / "linked"
+    git("worktree", "add", "-q", "-b", "feature", str(linked), cwd=repo)
+    git("pack-refs", "--all", cwd=repo)
+    assert not (repo / ".git" / "refs" / "heads" / "main").exists()
+    info, _ = assert_same_as_cli(repo, monkeypatch)
+    assert info["commit_hash"]
+    assert_same_as_cli(linked, monkeypatch)
+
+
+def test_insteadof_rewrites_remote(repo, monkeypatch):
+    git("config", "url.https://github.com/.insteadOf", "gh:", cwd=repo)
+    git("remote", "set-url", "origin", "gh:owner/project.git", cwd=repo)
+    info, _ = assert_same_as_cli(repo, monkeypatch)
+    assert info["remote_url"] == "https://github.com/owner/project.git"
+
+
+def test_global_insteadof(repo, monkeypatch):
+    with open(os.path.join(os.environ["HOME"], ".gitconfig"), "w") as config:
+        config.write('[url "git@example.com:"]\n\tinsteadOf = ex:\n')
+    git("remote", "set-url", "origin", "ex:team/project.git", cwd=repo)
+    info, _ = assert_same_as_cli(repo, monkeypatch)
+    assert info["remote_url"] == "git@example.com:team/project.git"
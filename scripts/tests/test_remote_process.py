@@ -0,0 +1,82 @@
+"""
+Commands started through AsyncMacOSBuilder run inside a pid-file wrapper on
+the host. These tests put a fake ssh on PATH that, like sshd, runs the
+remote command with the login shell ($SHELL -c) in a new session and
+leaves it running when the client is killed. $SHELL is a stand-in for zsh,
+the macOS default, in which $status is a read-only special parameter.
+"""
+
+import asyncio
+import os
+import stat
+import sys
+import time
+
+import pytest
+
+from git_utils import _run_sync
+from macos_builder import AsyncMacOSBuilder, MacOSBuilder
+
+
+FAKE_SSH = f"""#!{sys.executable}
+import os, signal, subprocess, sys
+process = subprocess.Popen([os.environ["SHELL"], "-c", sys.argv[-1]], start_new_session=True)
+# sshd does not stop the command when the client goes away
+signal.signal(signal.SIGTERM, lambda *_: os._exit(255))
+sys.exit(process.wait())
+"""
+
+ZSH_LIKE_SHELL = """#!/bin/bash
+exec bash -c "readonly status=0; $2"
+"""
+
+
+def write_executable(path, content):
+    path.write_text(content)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+
+
+@pytest.fixture
+def async_builder(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    write_executable(bin_dir / "ssh", FAKE_SSH)
+    write_executable(bin_dir / "login-shell", ZSH_LIKE_SHELL)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("SHELL", str(bin_dir / "login-shell"))
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("MACOS_SSH_MULTIPLEX", "false")
+    return AsyncMacOSBuilder(MacOSBuilder(working_directory=str(tmp_path)))
+
+
+def start(async_builder, command):
+    return async_builder._start(command, None, None, None, None)
+
+
+def test_wrapper_keeps_exit_code_and_removes_pid_file(async_builder):
+    async def run():
+        remote = await start(async_builder, "echo output; exit 3")
+        return remote, await remote.wait()
+
+    remote, returncode = _run_sync(run())
+    assert returncode == 3
+    assert not os.path.exists(remote.pid_file)
+
+
+def test_terminate_stops_remote_command_ignoring_hangup(async_builder, tmp_path):
+    marker = tmp_path / "survived"
+
+    async def run():
+        remote = await start(async_builder, f"trap '' HUP; sleep 2 && touch {marker}")
+        # Let the wrapper record its pid
+        for _ in range(50):
+            if os.path.exists(remote.pid_file):
+                break
+            await asyncio.sleep(0.05)
+        await remote.terminate(grace=1)
+        return remote
+
+    remote = _run_sync(run())
+    time.sleep(2.5)
+    assert not marker.exists()
+    assert not os.path.exists(remote.pid_file)
@@ -4,6 +4,46 @@ trap 'echo "$0: line $LINENO: $BASH_COMMAND: exitcode $?"' ERR
 # ABOUTME: Wrapper script to run Claude Code in Docker container
 # ABOUTME: Handles project mounting, .claude setup, and environment variables
 
+# Launch tracing: with CLAUDE_DOCKER_TRACE=1 every phase below is written as a
+# complete event to a Chrome trace-event file in ~/.claude-docker/traces/.
+# The closing "]" is left off (allowed by the format) so startup.sh can append
+# the container phases to the same file. Summarize with scripts/launch_trace.py.
+TRACE_FILE=""
+TRACE_PHASE=""
+TRACE_PHASE_CAT=""
+TRACE_PHASE_START=0
+
+trace_now() {
+    if [ -n "${EPOCHREALTIME:-}" ]; then
+        TRACE_NOW="${EPOCHREALTIME/[.,]/}"
+    else
+        # bash < 5 (the macOS /bin/bash) has no EPOCHREALTIME
+        TRACE_NOW=$(python3 -c 'import time; print(int(time.time() * 1000000))')
+    fi
+}
+
+# Close the running phase and start the next one: trace_phase [name [category]]
+trace_phase() {
+    [ -n "$TRACE_FILE" ] || return 0
+    trace_now
+    if [ -n "$TRACE_PHASE" ]; then
+        printf '{"name":"%s","cat":"%s","ph":"X","ts":%s,"dur":%s,"pid":%s,"tid":1},\n' \
+            "$TRACE_PHASE" "$TRACE_PHASE_CAT" "$TRACE_PHASE_START" "$((TRACE_NOW - TRACE_PHASE_START))" "$$" >> "$TRACE_FILE"
+    fi
+    TRACE_PHASE="${1:-}"
+    TRACE_PHASE_CAT="${2:-launcher}"
+    TRACE_PHASE_START="$TRACE_NOW"
+}
+
+if [ "${CLAUDE_DOCKER_TRACE:-0}" = "1" ] || [ "${CLAUDE_DOCKER_TRACE:-}" = "true" ]; then
+    TRACE_DIR="$HOME/.claude-docker/traces"
+    TRACE_ID="$(date +%Y%m%d-%H%M%S)-$$"
+    mkdir -p "$TRACE_DIR"
+    TRACE_FILE="$TRACE_DIR/$TRACE_ID.json"
+    printf '[\n{"name":"process_name","ph":"M","pid":%s,"args":{"name":"claude-docker.sh"}},\n' "$$" > "$TRACE_FILE"
+    trace_phase "parse_args"
+fi
+
 # Parse command line arguments
 DOCKER="${DOCKER:-docker}"
 NO_CACHE=""
@@ -59,7 +99,7 @@ detect_git_worktree() {
 
     # Use our git_utils.py to get repository information
     if command -v python3 >/dev/null 2>&1 && [ -f "$PROJECT_ROOT/scripts/git_utils.py" ]; then
-        git_info_json=$(python3 "$PROJECT_ROOT/scripts/git_utils.py" json 2>/dev/null)
+        git_info_json=$(python3 "$PROJECT_ROOT/scripts/git_utils.py" cached-json 2>/dev/null)
         if [ $? -eq 0 ] && [ -n "$git_info_json" ]; then
             # Parse JSON to check if this is a worktree
             is_worktree=$(echo "$git_info_json" | python3 -c "import sys, json; data=json.load(sys.stdin); print(data.get('is_worktree', False))" 2>/dev/null)
@@ -90,6 +130,7 @@ if main_worktree:
 }
 
 # Detect git worktree before proceeding
+trace_phase "git_worktree_detection"
 echo "Checking git repository status..."
 WORKTREE_INFO=$(detect_git_worktree)
 eval "$WORKTREE_INFO"
@@ -104,6 +145,7 @@ else
 fi
 
 # Check if .claude directory exists in current project, create if not
+trace_phase "project_setup"
 if [ ! -d "$CURRENT_DIR/.claude" ]; then
     echo "Creating .claude directory for this project..."
     mkdir -p "$CURRENT_DIR/.claude"
@@ -132,6 +174,7 @@ if [ "$WORKTREE_DETECTED" = "true" ] && [ -f "$MAIN_REPO_PATH/.env" ] && [ ! -f
 fi
 
 # Check if .env exists in claude-docker directory for building
+trace_phase "env_load"
 ENV_FILE="$PROJECT_ROOT/.env"
 if [ -f "$ENV_FILE" ]; then
     echo "✓ Found .env file with credentials"
@@ -157,6 +200,7 @@ if [ -z "${GPU_ACCESS:-}" ] && [ -n "${DOCKER_GPU_ACCESS:-}" ]; then
 fi
 
 # Check if we need to rebuild the image
+trace_phase "image_check"
 NEED_REBUILD=false
 
 if ! "$DOCKER" images | grep -q "claude-docker"; then
@@ -175,6 +219,7 @@ if [ -n "${NO_CACHE:-}" ] && [ "$NEED_REBUILD" = false ]; then
 fi
 
 if [ "$NEED_REBUILD" = true ]; then
+    trace_phase "image_build"
     # Copy authentication files to build context
     if [ -f "$HOME/.claude.json" ]; then
         cp "$HOME/.claude.json" "$PROJECT_ROOT/.claude.json"
@@ -201,6 +246,7 @@ if [ "$NEED_REBUILD" = true ]; then
 fi
 
 # Ensure the claude-home, ssh, and git-backups directories exist
+trace_phase "host_setup"
 mkdir -p "$HOME/.claude-docker/claude-home"
 mkdir -p "$HOME/.claude-docker/ssh"
 mkdir -p "$HOME/.claude-docker/git-backups"
@@ -323,11 +369,13 @@ check_macos_ssh_connectivity() {
 }
 
 # Check macOS SSH connectivity if enabled
+trace_phase "macos_ssh_check"
 if [ "${ENABLE_MACOS_BUILDS:-false}" = "true" ]; then
     check_macos_ssh_connectivity
 fi
 
 # Prepare additional mount arguments
+trace_phase "gpu_detection"
 MOUNT_ARGS=""
 ENV_ARGS=""
 DOCKER_OPTS=""
@@ -352,6 +400,7 @@ if [ -n "${GPU_ACCESS:-}" ]; then
 fi
 
 # Mount conda installation if specified
+trace_phase "conda_mounts"
 if [ -n "${CONDA_PREFIX:-}" ] && [ -d "$CONDA_PREFIX" ]; then
     echo "✓ Mounting conda installation from $CONDA_PREFIX"
     MOUNT_ARGS="$MOUNT_ARGS -v $CONDA_PREFIX:$CONDA_PREFIX:ro"
@@ -404,6 +453,7 @@ else
 fi
 
 # Prepare macOS host SSH key mounting
+trace_phase "worktree_setup"
 HOST_SSH_MOUNT=""
 if [ "${ENABLE_MACOS_BUILDS:-false}" = "true" ] && [ -d "$HOME/.claude-docker/ssh/host_keys" ]; then
     HOST_SSH_MOUNT="-v $HOME/.claude-docker/ssh/host_keys:/home/claude-user/.ssh/host_keys:ro"
@@ -450,6 +500,15 @@ if [ "$WORKTREE_DETECTED" = "true" ] && [ -f "$CURRENT_DIR/.git" ]; then
     echo "  ✓ Git worktree configured for container use"
 fi
 
+# Share the trace with the container so startup.sh can add its phases. The
+# docker_run span lasts the whole session; the container start cost is the
+# container_start span startup.sh measures from CLAUDE_DOCKER_TRACE_LAUNCH_TS.
+trace_phase "docker_run" "session"
+TRACE_ARGS=""
+if [ -n "$TRACE_FILE" ]; then
+    TRACE_ARGS="-v $TRACE_DIR:/home/claude-user/.claude-docker/traces:rw -e CLAUDE_DOCKER_TRACE_FILE=/home/claude-user/.claude-docker/traces/$TRACE_ID.json -e CLAUDE_DOCKER_TRACE_LAUNCH_TS=$TRACE_PHASE_START"
+fi
+
 # Run Claude Code in Docker
 echo "Starting Claude Code in Docker..."
 "$DOCKER" run -it --rm \
@@ -465,6 +524,7 @@ echo "Starting Claude Code in Docker..."
     $MOUNT_ARGS \
     $ENV_ARGS \
     $WORKTREE_ENV \
+    $TRACE_ARGS \
     -e CLAUDE_CONTINUE_FLAG="$CONTINUE_FLAG" \
     -e ENABLE_MACOS_BUILDS="${ENABLE_MACOS_BUILDS:-false}" \
     -e MACOS_USERNAME="${MACOS_USERNAME:-$(whoami)}" \
@@ -475,5 +535,6 @@ echo "Starting Claude Code in Docker..."
 
 # Clean up after Docker exits normally
 DOCKER_EXIT_CODE=$?
+trace_phase
 cleanup_host_worktree
 exit $DOCKER_EXIT_CODE
@@ -6,6 +6,46 @@ trap 'echo "$0: line $LINENO: $BASH_COMMAND: exitcode $?"' ERR
 # ABOUTME: Loads twilio env vars, checks for .credentials.json, copies CLAUDE.md template if no claude.md in claude-docker/claude-home.
 # ABOUTME: Starts claude code with permissions bypass and continues from last session.
 
+# Launch tracing: claude-docker.sh passes CLAUDE_DOCKER_TRACE_FILE (mounted from
+# ~/.claude-docker/traces/) when CLAUDE_DOCKER_TRACE=1; the container phases
+# are appended to the launcher's trace
+TRACE_FILE="${CLAUDE_DOCKER_TRACE_FILE:-}"
+TRACE_PHASE=""
+TRACE_PHASE_START=0
+if [ -n "$TRACE_FILE" ] && [ ! -w "$TRACE_FILE" ]; then
+    TRACE_FILE=""
+fi
+
+trace_now() {
+    TRACE_NOW="${EPOCHREALTIME/[.,]/}"
+}
+
+# Close the running phase and start the next one: trace_phase [name]
+trace_phase() {
+    [ -n "$TRACE_FILE" ] || return 0
+    trace_now
+    if [ -n "$TRACE_PHASE" ]; then
+        printf '{"name":"%s","cat":"container","ph":"X","ts":%s,"dur":%s,"pid":%s,"tid":1},\n' \
+            "$TRACE_PHASE" "$TRACE_PHASE_START" "$((TRACE_NOW - TRACE_PHASE_START))" "$$" >> "$TRACE_FILE"
+    fi
+    TRACE_PHASE="${1:-}"
+    TRACE_PHASE_START="$TRACE_NOW"
+}
+
+if [ -n "$TRACE_FILE" ]; then
+    trace_now
+    printf '{"name":"process_name","ph":"M","pid":%s,"args":{"name":"startup.sh (container)"}},\n' "$$" >> "$TRACE_FILE"
+    # From `docker run` on the host to this script starting in the container
+    LAUNCH_TS="${CLAUDE_DOCKER_TRACE_LAUNCH_TS:-$TRACE_NOW}"
+    CONTAINER_START_DUR=$((TRACE_NOW - LAUNCH_TS))
+    if [ "$CONTAINER_START_DUR" -lt 0 ]; then
+        CONTAINER_START_DUR=0
+    fi
+    printf '{"name":"start","cat":"container","ph":"X","ts":%s,"dur":%s,"pid":%s,"tid":1},\n' \
+        "$LAUNCH_TS" "$CONTAINER_START_DUR" "$$" >> "$TRACE_FILE"
+    trace_phase "env_load"
+fi
+
 # Load environment variables from .env if it exists
 if [ -f /app/.env ]; then
     echo "Loading environment from baked-in .env file"
@@ -21,6 +61,7 @@ else
 fi
 
 # Check for existing authentication
+trace_phase "claude_home_setup"
 if [ -f "$HOME/.claude/.credentials.json" ]; then
     echo "Found existing Claude authentication"
 else
@@ -43,6 +84,7 @@ fi
 
 
 # macOS builder check
+trace_phase "macos_builder_status"
 echo "Checking macOS native build support..."
 if [ "${ENABLE_MACOS_BUILDS:-false}" = "true" ]; then
     if command -v python3 >/dev/null 2>&1 && [ -f "/home/claude-user/scripts/macos_builder.py" ]; then
@@ -64,6 +106,7 @@ else
 fi
 
 # Twilio check
+trace_phase "mcp_check"
 if [ -n "$TWILIO_ACCOUNT_SID" ] && [ -n "$TWILIO_AUTH_TOKEN" ]; then
     echo "✓ Twilio MCP server configured"
 else
@@ -71,5 +114,11 @@ else
 fi
 
 # Start Claude Code directly with exec
+trace_phase
+if [ -n "$TRACE_FILE" ]; then
+    trace_now
+    printf '{"name":"exec_claude","cat":"container","ph":"i","s":"g","ts":%s,"pid":%s,"tid":1},\n' \
+        "$TRACE_NOW" "$$" >> "$TRACE_FILE"
+fi
 echo "Starting Claude Code..."
 exec claude $CLAUDE_CONTINUE_FLAG --dangerously-skip-permissions "$@"